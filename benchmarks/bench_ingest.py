@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+'''
+Measures the time :func:`burp_exporter.client.Client.parse_message` takes to ingest the client list of a large server
+at different log levels, and the time the eager formatting of the message and the client list (as previously done by
+f-strings in debug calls) adds on top.
+
+Usage: ``python benchmarks/bench_ingest.py [clients] [repetitions]``
+'''
+
+import logging
+import sys
+import timeit
+
+from burp_exporter.client import Client
+from burp_exporter.logutil import set_payload_mode
+from burp_exporter.types import ClientSettings
+
+from bench_render import make_message
+
+
+class NullFormatHandler(logging.Handler):
+    '''
+    Formats records like a real handler would, but discards the result.
+    '''
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.format(record)
+
+
+def make_client() -> Client:
+    return Client(ClientSettings(name='bench', cname='burp', password='abcdefgh', burp_host='127.0.0.1',
+                                 burp_port=4972, burp_cname='burpserver', tls_ca_cert='ca.pem', tls_cert='client.pem',
+                                 tls_key='client.key'))
+
+
+def ingest(message: dict) -> None:
+    make_client().parse_message(message)
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    message = make_message(count)
+
+    log = logging.getLogger('burp_exporter')
+    log.addHandler(NullFormatHandler())
+    log.propagate = False
+
+    results = list()
+    for name, level, mode in [('INFO', logging.INFO, 'summary'),
+                              ('DEBUG summary', logging.DEBUG, 'summary'),
+                              ('DEBUG full', logging.DEBUG, 'full')]:
+        log.setLevel(level)
+        set_payload_mode(mode)
+        results.append((name, min(timeit.repeat(lambda: ingest(message), number=1, repeat=repeat))))
+    client = make_client()
+    client.parse_message(message)
+    clients = client._clients
+
+    def eager_format() -> None:
+        # what parse_message formatted on every refresh before, regardless of the log level
+        f'parse_message: {message}'
+        f'List before cleanup: {clients}'
+        f'List after cleanup: {clients}'
+
+    eager = min(timeit.repeat(eager_format, number=1, repeat=repeat))
+
+    print(f'{count} clients, best of {repeat}')
+    for name, t in results:
+        print(f'{name:<15} {t * 1000:8.2f} ms')
+    print(f'{"eager f-string":<15} {eager * 1000:8.2f} ms (message and client list formatting, previously paid at any level)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+'''
+Compares the columnar renderer (:func:`burp_exporter.store.render`) against the registry based
+:func:`burp_exporter.handler.generate` for a server with a large number of clients.
+
+Usage: ``python benchmarks/bench_render.py [clients] [repetitions]``
+'''
+
+import sys
+import timeit
+
+from burp_exporter.client import Client
+from burp_exporter.handler import generate
+from burp_exporter.store import render
+from burp_exporter.types import ClientSettings
+
+
+def make_message(count: int) -> dict:
+    clients = list()
+    for i in range(count):
+        clients.append({
+            'name': f'client{i:05d}',
+            'labels': ['team=ops'],
+            'run_status': 'running' if i % 50 == 0 else 'idle',
+            'protocol': 1,
+            'backups': [{'number': i, 'timestamp': 1567146136 + i, 'flags': ['current', 'manifest'],
+                         'logs': {'list': ['backup', 'backup_stats']}}],
+        })
+    return {'clients': clients}
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    client = Client(ClientSettings(name='bench', cname='burp', password='abcdefgh', burp_host='127.0.0.1',
+                                   burp_port=4972, burp_cname='burpserver', tls_ca_cert='ca.pem',
+                                   tls_cert='client.pem', tls_key='client.key'))
+    client.parse_message(make_message(count))
+
+    t_generate = min(timeit.repeat(lambda: generate([client.registry]), number=1, repeat=repeat))
+    t_render = min(timeit.repeat(lambda: render([client.store]), number=1, repeat=repeat))
+    print(f'{count} clients, best of {repeat}')
+    print(f'generate(): {t_generate * 1000:8.2f} ms')
+    print(f'render():   {t_render * 1000:8.2f} ms')
+    print(f'speedup:    {t_generate / t_render:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+'''
+Measures the cold start of the exporter: the time to import :mod:`burp_exporter.cli` in a fresh interpreter, and the
+time from starting the daemon until ``/metrics`` answers and until the first connection attempt to every server has
+finished. The servers are simulated by local TLS listeners that delay the handshake by `delay` seconds and close the
+connection afterwards, so every attempt takes about `delay` seconds and then fails.
+
+To guard against regressions, the script exits with status 1 if the import takes longer than ``MAX_IMPORT_MS``, or
+if reaching all servers takes longer than the handshake delay plus ``MAX_OVERHEAD_MS``, which only holds if the servers
+are connected concurrently. Both limits can be overridden with environment variables of the same name.
+
+Requires the ``openssl`` command to create a throwaway certificate.
+
+Usage: ``python benchmarks/bench_startup.py [servers] [delay] [repetitions]``
+'''
+
+import os
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import List, Tuple
+
+HTTP_PORT = 19645
+#: Upper limit for importing the cli module
+MAX_IMPORT_MS = float(os.environ.get('MAX_IMPORT_MS', 150))
+#: Upper limit for the time until all servers were attempted, on top of the handshake delay of a single server
+MAX_OVERHEAD_MS = float(os.environ.get('MAX_OVERHEAD_MS', 1500))
+
+
+def import_time(repeat: int) -> float:
+    '''
+    Returns the best time to import the cli module in a fresh interpreter, minus the interpreter startup.
+    '''
+    def run(code: str) -> float:
+        t = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        return time.perf_counter() - t
+
+    base = min(run('pass') for _ in range(repeat))
+    return min(run('import burp_exporter.cli') for _ in range(repeat)) - base
+
+
+def make_cert(directory: str) -> Tuple[str, str]:
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-subj', '/CN=burp', '-addext',
+                    'subjectAltName=DNS:burp', '-days', '1', '-keyout', key, '-out', cert],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def slow_server(cert: str, key: str, delay: float) -> int:
+    '''
+    Starts a listener that completes the TLS handshake `delay` seconds after accepting, then closes the connection.
+
+    :return: The port of the listener.
+    '''
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    lsock = socket.socket()
+    lsock.bind(('127.0.0.1', 0))
+    lsock.listen(16)
+
+    def handle(conn: socket.socket) -> None:
+        time.sleep(delay)
+        try:
+            with context.wrap_socket(conn, server_side=True):
+                pass
+        except OSError:
+            conn.close()
+
+    def serve() -> None:
+        while True:
+            conn, _ = lsock.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return lsock.getsockname()[1]
+
+
+def write_config(directory: str, ports: List[int], cert: str, key: str) -> str:
+    path = os.path.join(directory, 'config.yaml')
+    with open(path, 'wt') as fh:
+        fh.write(f'bind_address: 127.0.0.1\nbind_port: {HTTP_PORT}\nclients:\n')
+        for i, port in enumerate(ports):
+            fh.write(f'  - name: server{i}\n    burp_host: 127.0.0.1\n    burp_port: {port}\n    burp_cname: burp\n'
+                     f'    cname: exporter\n    password: abcdefgh\n    tls_ca_cert: {cert}\n'
+                     f'    tls_cert: {cert}\n    tls_key: {key}\n')
+    return path
+
+
+def time_to_probe(config: str, servers: int) -> Tuple[float, float]:
+    '''
+    Starts the daemon and polls ``/metrics``.
+
+    :return: Seconds until the endpoint answered, and until ``burp_up`` was reported for every server, which happens
+        once the first connection attempts are done.
+    '''
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', 'from burp_exporter.cli import cli; cli()', '-c', config],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_answer = None
+    try:
+        while time.perf_counter() - start < 120:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{HTTP_PORT}/metrics', timeout=1) as resp:
+                    body = resp.read().decode('utf-8')
+            except OSError:
+                time.sleep(0.005)
+                continue
+            if first_answer is None:
+                first_answer = time.perf_counter() - start
+            if body.count('burp_up{') >= servers:
+                return first_answer, time.perf_counter() - start
+            time.sleep(0.005)
+        raise RuntimeError('Daemon did not report all servers in time')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> None:
+    servers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    import_ms = import_time(repeat) * 1000
+    print(f'import burp_exporter.cli  {import_ms:8.2f} ms (best of {repeat})')
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_cert(directory)
+        ports = [slow_server(cert, key, delay) for _ in range(servers)]
+        config = write_config(directory, ports, cert, key)
+        results = [time_to_probe(config, servers) for _ in range(repeat)]
+    print(f'{servers} servers, handshake delayed by {delay} seconds, best of {repeat}')
+    print(f'first /metrics answer     {min(r[0] for r in results) * 1000:8.2f} ms')
+    attempted_ms = min(r[1] for r in results) * 1000
+    print(f'all servers attempted     {attempted_ms:8.2f} ms')
+
+    failed = False
+    if import_ms > MAX_IMPORT_MS:
+        print(f'FAIL: import took longer than {MAX_IMPORT_MS} ms')
+        failed = True
+    if attempted_ms > delay * 1000 + MAX_OVERHEAD_MS:
+        print(f'FAIL: reaching all servers took longer than {delay * 1000 + MAX_OVERHEAD_MS} ms')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
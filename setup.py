@@ -37,6 +37,7 @@ setup(
     entry_points={
         'console_scripts': [
             'burp_exporter=burp_exporter.cli:cli',
+            'burp_exporter_replay=burp_exporter.replay:main',
         ],
     },
 
@@ -0,0 +1,94 @@
+
+from typing import Dict, Set, Tuple
+
+from .types import ClientInfo
+
+#: A burp label of the form ``key=value``, split into its parts
+Label = Tuple[str, str]
+
+
+def split_labels(info: ClientInfo) -> Tuple[Label, ...]:
+    '''
+    Returns the ``key=value`` labels of the client. Labels without ``=`` are ignored, duplicates are counted once.
+    '''
+    if not info.labels:
+        return ()
+    return tuple(sorted({tuple(lbl.split('=', 1)) for lbl in info.labels if '=' in lbl}))  # type: ignore
+
+
+class LabelAggregates:
+    '''
+    Counts clients per burp label of the form ``key=value``: all clients, running clients and overdue clients. The
+    counts are maintained incrementally: each update removes the previous contribution of a client before adding the
+    new one, so only changed and removed clients are touched.
+    '''
+
+    def __init__(self) -> None:
+        # contribution of each client: its labels and whether it is running
+        self._contrib: Dict[str, Tuple[Tuple[Label, ...], bool]] = dict()
+        self._overdue: Set[str] = set()
+        self.clients: Dict[Label, int] = dict()
+        self.running: Dict[Label, int] = dict()
+        self.overdue: Dict[Label, int] = dict()
+
+    def _add(self, name: str, sign: int) -> None:
+        labels, running = self._contrib[name]
+        overdue = name in self._overdue
+        for label in labels:
+            self._count(self.clients, label, sign)
+            if running:
+                self._count(self.running, label, sign)
+            if overdue:
+                self._count(self.overdue, label, sign)
+
+    @staticmethod
+    def _count(counts: Dict[Label, int], label: Label, sign: int) -> None:
+        # labels that are no longer in use are dropped, so the counters do not grow over time
+        value = counts.get(label, 0) + sign
+        if value:
+            counts[label] = value
+        else:
+            counts.pop(label, None)
+
+    def update(self, info: ClientInfo) -> None:
+        '''
+        Adds a new client or updates a changed one.
+        '''
+        if info.name in self._contrib:
+            self._add(info.name, -1)
+        self._contrib[info.name] = (split_labels(info), info.run_status == 'running')
+        self._add(info.name, 1)
+
+    def remove(self, name: str) -> None:
+        '''
+        Removes a client.
+        '''
+        if name in self._contrib:
+            self._add(name, -1)
+            del self._contrib[name]
+        self._overdue.discard(name)
+
+    def set_overdue(self, overdue: Set[str]) -> None:
+        '''
+        Updates the overdue counts from the set of overdue clients, touching only the clients whose state changed.
+        '''
+        for name in overdue - self._overdue:
+            if name in self._contrib:
+                for label in self._contrib[name][0]:
+                    self._count(self.overdue, label, 1)
+        for name in self._overdue - overdue:
+            if name in self._contrib:
+                for label in self._contrib[name][0]:
+                    self._count(self.overdue, label, -1)
+        self._overdue = set(overdue)
+
+    def columns(self, counts: Dict[Label, int]) -> dict:
+        '''
+        Returns the columns (as keyword arguments for :func:`~burp_exporter.store.MetricFamily.replace`) for a family
+        with the labels ``label`` and ``value``. All labels in use by at least one client are included.
+
+        :param counts: One of ``clients``, ``running`` or ``overdue``.
+        '''
+        keys = sorted(self.clients)
+        return {'names': [k[0] for k in keys], 'values': [counts.get(k, 0) for k in keys],
+                'extra': [(k[1],) for k in keys]}
@@ -0,0 +1,113 @@
+
+import bisect
+import json
+from typing import Dict, List, Optional, Set
+
+from .types import ClientInfo
+
+#: Default number of clients per page
+DEFAULT_LIMIT = 100
+#: Maximum number of clients per page
+MAX_LIMIT = 1000
+
+
+class ApiError(Exception):
+    '''
+    Raised for invalid API requests, carries the HTTP status code.
+    '''
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class ClientSnapshot:
+    '''
+    Immutable view of the clients of one server as plain dicts, ready to be served as JSON. A new snapshot is derived
+    from the previous one after each refresh by :func:`~burp_exporter.api.ClientSnapshot.update`, which converts only
+    the clients that changed.
+
+    Each entry carries the field ``updated``, the number of the refresh in which the client last changed.
+    '''
+
+    def __init__(self, refresh: int = 0, names: Optional[List[str]] = None, entries: Optional[Dict[str, dict]] = None,
+                 encoded: Optional[Dict[str, str]] = None) -> None:
+        #: Number of the refresh the snapshot was taken after
+        self.refresh = refresh
+        self._names: List[str] = names or list()
+        self._entries: Dict[str, dict] = entries or dict()
+        self._encoded: Dict[str, str] = encoded or dict()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def update(self, refresh: int, clients: List[ClientInfo], changed: Set[str]) -> 'ClientSnapshot':
+        '''
+        Returns a new snapshot for the `clients`, where only the clients in `changed` (and new ones) are converted.
+
+        :param refresh: Number of the refresh.
+        :param clients: All clients of the server.
+        :param changed: Names of the clients whose data changed in this refresh.
+        '''
+        entries: Dict[str, dict] = dict()
+        encoded: Dict[str, str] = dict()
+        for info in clients:
+            if info.name in changed or info.name not in self._entries:
+                entry = info.dict()
+                entry['updated'] = refresh
+                entries[info.name] = entry
+                encoded[info.name] = json.dumps(entry)
+            else:
+                entries[info.name] = self._entries[info.name]
+                encoded[info.name] = self._encoded[info.name]
+        return ClientSnapshot(refresh, sorted(entries), entries, encoded)
+
+    def page(self, fields: Optional[List[str]] = None, cursor: Optional[str] = None, limit: int = DEFAULT_LIMIT,
+             since: Optional[int] = None) -> bytes:
+        '''
+        Renders a page of clients as JSON. Clients are ordered by name.
+
+        :param fields: Only include these fields (``name`` is always included).
+        :param cursor: Start after the client with this name, as returned in ``next_cursor`` of the previous page.
+        :param limit: Maximum number of clients in the page.
+        :param since: Only include clients that changed after the refresh with this number.
+        '''
+        if limit < 1 or limit > MAX_LIMIT:
+            raise ApiError(400, f'limit must be between 1 and {MAX_LIMIT}')
+        start = bisect.bisect_right(self._names, cursor) if cursor is not None else 0
+        selected: List[str] = list()
+        next_cursor: Optional[str] = None
+        for name in self._names[start:]:
+            if since is not None and self._entries[name]['updated'] <= since:
+                continue
+            if len(selected) == limit:
+                next_cursor = selected[-1]
+                break
+            selected.append(name)
+
+        if fields is None:
+            clients = ','.join(self._encoded[name] for name in selected)
+        else:
+            keep = set(fields) | {'name'}
+            clients = ','.join(json.dumps({k: v for k, v in self._entries[name].items() if k in keep}) for name in selected)
+        return (f'{{"refresh":{self.refresh},"next_cursor":{json.dumps(next_cursor)},"clients":[{clients}]}}').encode('utf-8')
+
+
+def parse_page_params(params: Dict[str, List[str]]) -> dict:
+    '''
+    Converts the query parameters of a request into keyword arguments for
+    :func:`~burp_exporter.api.ClientSnapshot.page`.
+    '''
+    kwargs: dict = dict()
+    try:
+        if 'fields' in params:
+            kwargs['fields'] = [f for v in params['fields'] for f in v.split(',') if f]
+        if 'cursor' in params:
+            kwargs['cursor'] = params['cursor'][0]
+        if 'limit' in params:
+            kwargs['limit'] = int(params['limit'][0])
+        if 'since' in params:
+            kwargs['since'] = int(params['since'][0])
+    except ValueError as e:
+        raise ApiError(400, f'Invalid parameter: {str(e)}') from e
+    return kwargs
@@ -2,12 +2,11 @@
 import argparse
 import logging
 import sys
-from pkg_resources import get_distribution
 
-from . import handler
-from .daemon import Daemon
+from .logutil import PAYLOAD_MODES, set_payload_mode
+from .version import get_version
 
-__version__ = get_distribution('burp_exporter').version
+__version__ = get_version()
 
 
 def setup_argparse():
@@ -23,6 +22,10 @@ The exporter does not create its own certificates, but used the ones generated
 by a regular burp(8) client.''')
     parser.add_argument('-c', '--config', default='/etc/burp_exporter/burp_exporter.yaml', type=str, help='YAML configuration file, defaults to /etc/burp_exporter/burp_exporter.yaml')
     parser.add_argument('-d', '--debug', action='store_true', help='Log at debug level, print to stdout')
+    parser.add_argument('--debug-payloads', choices=PAYLOAD_MODES, default='summary',
+                        help='How received data is logged at debug level: "summary" (default) logs sizes and counts,\n"full" logs the data truncated to --debug-payload-chars characters')
+    parser.add_argument('--debug-payload-chars', type=int, default=2048, metavar='N', help='Truncate payloads to N characters with --debug-payloads=full')
+    parser.add_argument('--record', type=str, metavar='FILE', help='Append all data received from the burp servers to FILE,\nfor use with burp_exporter_replay')
     parser.add_argument('--version', action='version', version=__version__)
 
     return parser
@@ -31,9 +34,13 @@ by a regular burp(8) client.''')
 def cli():
     args = setup_argparse().parse_args()
     log = setup_logging(args.debug)
+    set_payload_mode(args.debug_payloads, args.debug_payload_chars)
 
+    # imported here so --help and --version don't pay for loading the daemon and its dependencies
+    from . import handler
+    from .daemon import Daemon
     try:
-        handler.DAEMON = Daemon(args.config)
+        handler.DAEMON = Daemon(args.config, record=args.record)
     except Exception as e:
         log.critical(f'Error during setup: {str(e)}')
         print(str(e))
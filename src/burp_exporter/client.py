@@ -1,34 +1,135 @@
 
 import datetime
+import fnmatch
+import hashlib
 import json
 import logging
 import select
 import socket as sock
 import ssl
+import time
 
-from prometheus_client.core import CollectorRegistry, CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.core import CollectorRegistry
 from pydantic import ValidationError
-from typing import List, Optional, Set
-
+from typing import Dict, List, Optional, Set, Tuple
+
+from .aggregates import LabelAggregates
+from .api import ClientSnapshot
+from .history import ClientHistory
+from .logutil import full_payloads, payload
+from .progress import Progress, parse_progress
+from .recorder import KIND_COMPLETE, KIND_HANDSHAKE, KIND_PARTIAL, KIND_QUERY, Recorder
+from .sla import SlaEvaluator, SlaPolicy
+from .store import MetricStore
 from .types import ClientSettings, ClientInfo
 
+#: Query for the list of clients
+QUERY_LIST = 'list'
+#: Query for the details of a running client, see :func:`~burp_exporter.client.Client.parse_progress`
+QUERY_PROGRESS = 'progress'
+#: Heartbeat query, the answer is discarded
+QUERY_HEARTBEAT = 'heartbeat'
+
+
+#: The frame burp sends at the end of each answer
+TERMINATOR = b'c0001\n'
+
+
+class ReceiveLimitError(IOError):
+    '''
+    Raised if the data received from a server exceeds one of the receive limits in its
+    :class:`~burp_exporter.types.ClientSettings`.
+    '''
+
+
+class ProtocolError(IOError):
+    '''
+    Raised if the data received from a server does not follow the protocol.
+    '''
+
+
+def fingerprint(entry: dict) -> bytes:
+    '''
+    Returns a digest of a client entry as received from the server, which is compared instead of keeping the entry.
+    '''
+    return hashlib.blake2b(json.dumps(entry, separators=(',', ':')).encode('utf-8'), digest_size=16).digest()
+
 
 class Client:
 
-    def __init__(self, config: ClientSettings) -> None:
+    def __init__(self, config: ClientSettings, recorder: Optional[Recorder] = None, sla: Optional[SlaPolicy] = None) -> None:
         self._config = config
+        # evaluates the maximum backup age if a policy is configured
+        self._sla = SlaEvaluator(sla) if sla is not None else None
+        # if set, all data received from the server is recorded
+        self._recorder = recorder
         self._log = logging.getLogger(f'burp_exporter.client.{self._config.name}')
         self._socket: Optional[ssl.SSLSocket] = None
-        self._buf: bytes = b''
+        self._buf = bytearray()
+        # offset of the next frame header in the buffer whose length was not checked yet
+        self._scan: int = 0
+        self._limit_exceeded: int = 0
         self._connected: bool = False
         self._clients: List[ClientInfo] = list()
+        # fingerprints of the client entries received by the last refresh, used to detect changes
+        self._fingerprints: Dict[str, bytes] = dict()
+        self._snapshot = ClientSnapshot()
+        self._history: Dict[str, ClientHistory] = dict()
+        self._aggregates = LabelAggregates()
         self._ts_last_query: datetime.datetime = datetime.datetime.utcnow() - datetime.timedelta(seconds=self._config.refresh_interval_seconds)
         self._ts_last_connect_attempt: datetime.datetime = datetime.datetime.utcnow() - datetime.timedelta(seconds=self._config.refresh_interval_seconds)
         self._parse_errors: int = 0
+        # effective refresh interval, adapted to backup activity if adaptive_refresh is enabled
+        self._interval: float = self._clamp_interval(self._config.refresh_interval_seconds)
         # indicates if a query waits for answer
         self._in_flight = False
+        # kind of query in flight, one of the QUERY_* constants
+        self._query_kind = QUERY_LIST
+        self._ts_query_sent: datetime.datetime = datetime.datetime.utcnow()
+        self._timeouts: int = 0
+        # names of the clients that were running at the last refresh, and their progress
+        self._running: Set[str] = set()
+        self._progress: Dict[str, Progress] = dict()
+        # running clients whose progress is yet to be queried in the current round
+        self._progress_queue: List[str] = list()
+        self._ts_last_progress: datetime.datetime = datetime.datetime.utcnow()
+        # incremented each time the metric store is rebuilt from a server response
+        self._updates: int = 0
+        # other config entries that share the connection of this client, see attach()
+        self._views: List['Client'] = list()
+        # the client whose connection this client shares, if any
+        self._primary: Optional['Client'] = None
         self._registry = CollectorRegistry()
 
+        self._store = MetricStore(self._config.name)
+        self._fam_last_contact = self._store.family('burp_last_contact', 'Time when the burp server was last contacted')
+        self._fam_up = self._store.family('burp_up', 'Shows if the connection to the server is up')
+        self._fam_parse_errors = self._store.family('burp_parse_errors', 'Amount of time parsing the server response failed', 'counter')
+        self._fam_timeouts = self._store.family('burp_timeouts', 'Amount of queries that did not receive an answer in time', 'counter')
+        self._fam_limit_exceeded = self._store.family('burp_receive_limit_exceeded', 'Amount of times the connection was dropped because the server exceeded a receive limit', 'counter')
+        self._fam_refresh_interval = self._store.family('burp_refresh_interval_seconds', 'Effective interval between two queries to the server')
+        self._fam_clients = self._store.family('burp_clients', 'Number of clients known to the server')
+        self._fam_backup_num = self._store.family('burp_client_backup_num', 'Number of the most recent completed backup for a client', labelnames=['name'])
+        self._fam_backup_ts = self._store.family('burp_client_backup_timestamp', 'Timestamp of the most recent backup', labelnames=['name'])
+        self._fam_has_in_progress = self._store.family('burp_client_backup_has_in_progress', 'Indicates whether a backup with flag "working" is present', labelnames=['name'])
+        self._fam_run_status = self._store.family('burp_client_run_status', 'Current run status of the client', labelnames=['name', 'run_status'])
+        self._fam_backup_expected = self._store.family('burp_client_backup_expected_timestamp', 'Time the next backup is expected at, based on the recent backups', labelnames=['name'])
+        self._fam_backup_missed = self._store.family('burp_client_backup_missed', 'Number of backups missed since the last one, based on the recent backups', labelnames=['name'])
+        self._fam_status_age = self._store.family('burp_client_run_status_age_seconds', 'Seconds since the run status of the client last changed', labelnames=['name'])
+        self._fam_label_clients = self._store.family('burp_label_clients', 'Number of clients with the burp label key=value', labelnames=['label', 'value'])
+        self._fam_label_running = self._store.family('burp_label_clients_running', 'Number of running clients with the burp label key=value', labelnames=['label', 'value'])
+        if self._sla is not None:
+            self._fam_label_overdue = self._store.family('burp_label_clients_overdue', 'Number of overdue clients with the burp label key=value', labelnames=['label', 'value'])
+            self._fam_overdue = self._store.family('burp_client_backup_overdue', 'Indicates whether the most recent backup is older than the configured maximum age', labelnames=['name'])
+            self._fam_overdue_count = self._store.family('burp_clients_overdue', 'Number of clients whose most recent backup is older than the configured maximum age')
+        self._fam_progress_phase = self._store.family('burp_client_progress_phase', 'Phase of the running backup', labelnames=['name', 'phase'])
+        self._fam_progress_files = self._store.family('burp_client_progress_files', 'Files processed by the running backup', labelnames=['name'])
+        self._fam_progress_files_est = self._store.family('burp_client_progress_files_estimated', 'Files found while scanning by the running backup', labelnames=['name'])
+        self._fam_progress_bytes = self._store.family('burp_client_progress_bytes', 'Bytes processed by the running backup', labelnames=['name'])
+        self._fam_progress_bytes_est = self._store.family('burp_client_progress_bytes_estimated', 'Estimated bytes of the running backup', labelnames=['name'])
+        self._fam_progress_ratio = self._store.family('burp_client_progress_ratio', 'Completed fraction of the running backup', labelnames=['name'])
+        self._fam_throughput = self._store.family('burp_client_throughput_bytes_per_second', 'Bytes per second processed by the running backup since the previous update', labelnames=['name'])
+
         self._registry.register(self)
 
     def __repr__(self) -> str:
@@ -38,14 +139,45 @@ class Client:
     def name(self) -> str:
         return self._config.name
 
+    @property
+    def config(self) -> ClientSettings:
+        return self._config
+
     @property
     def socket(self) -> Optional[ssl.SSLSocket]:
         return self._socket
 
     @property
     def connected(self) -> bool:
+        if self._primary is not None:
+            return self._primary.connected
         return self._connected
 
+    @property
+    def primary(self) -> Optional['Client']:
+        '''
+        The client whose connection this client shares, or None if it has its own connection.
+        '''
+        return self._primary
+
+    @property
+    def views(self) -> List['Client']:
+        '''
+        The clients that share the connection of this client.
+        '''
+        return self._views
+
+    def attach(self, view: 'Client') -> None:
+        '''
+        Makes `view` share the connection of this client. The view never connects on its own; each answer received by
+        this client is handed to the view, filtered by its ``include_clients``. The server is queried at the shortest
+        refresh interval of this client and its views.
+        '''
+        if view._primary is not None or view._views:
+            raise ValueError(f'{view} already shares a connection')
+        view._primary = self
+        self._views.append(view)
+
     @property
     def last_connect_attempt(self) -> datetime.datetime:
         return self._ts_last_connect_attempt
@@ -55,8 +187,64 @@ class Client:
         return self._ts_last_query
 
     @property
-    def refresh_interval(self) -> int:
-        return self._config.refresh_interval_seconds
+    def refresh_interval(self) -> float:
+        '''
+        The effective refresh interval in seconds.
+        '''
+        return self._interval
+
+    @property
+    def query_interval(self) -> float:
+        '''
+        The interval in which the server is queried: the shortest effective refresh interval of this client and the
+        views sharing its connection.
+        '''
+        return min([self._interval] + [view._interval for view in self._views])
+
+    def _clamp_interval(self, interval: float) -> float:
+        return max(self._config.refresh_interval_min_seconds, min(self._config.refresh_interval_max_seconds, interval))
+
+    def adapt_interval(self, active: bool) -> None:
+        '''
+        Adapts the refresh interval to the backup activity if ``adaptive_refresh`` is enabled: while a backup is
+        running, the server is queried every ``refresh_interval_active_seconds``. Once everything is idle, the interval
+        grows by ``refresh_interval_decay`` with each refresh until it reaches ``refresh_interval_seconds``. The result
+        is always kept within ``refresh_interval_min_seconds`` and ``refresh_interval_max_seconds``.
+
+        :param active: Whether any client has a backup running.
+        '''
+        if not self._config.adaptive_refresh:
+            return
+        interval: float
+        if active:
+            interval = self._config.refresh_interval_active_seconds
+        else:
+            interval = min(self._interval * self._config.refresh_interval_decay, self._config.refresh_interval_seconds)
+        interval = self._clamp_interval(interval)
+        if interval != self._interval:
+            self._log.debug('Refresh interval changed from %s to %s seconds', self._interval, interval)
+        self._interval = interval
+
+    @property
+    def timeouts(self) -> int:
+        '''
+        Number of queries that did not receive an answer within the response timeout.
+        '''
+        return self._timeouts
+
+    @property
+    def limit_exceeded(self) -> int:
+        '''
+        Number of times the connection was dropped because the server exceeded a receive limit.
+        '''
+        return self._limit_exceeded
+
+    @property
+    def parse_errors(self) -> int:
+        '''
+        Number of answers or client entries that could not be parsed.
+        '''
+        return self._parse_errors
 
     @property
     def client_count(self) -> int:
@@ -66,62 +254,290 @@ class Client:
     def registry(self) -> CollectorRegistry:
         return self._registry
 
+    @property
+    def snapshot(self) -> ClientSnapshot:
+        '''
+        The clients as of the last refresh, see :class:`~burp_exporter.api.ClientSnapshot`.
+        '''
+        return self._snapshot
+
+    @property
+    def updates(self) -> int:
+        '''
+        Number of times the client list was updated from a server response.
+        '''
+        return self._updates
+
+    def memory_info(self) -> Dict[str, int]:
+        '''
+        Returns the size of the receive buffer and the number of entries kept per client, for diagnostic purposes. The
+        memory taken by the entries is not measured, see the allocations reported by tracemalloc for that.
+        '''
+        return {
+            'buf_bytes': len(self._buf),
+            'clients': len(self._clients),
+            'fingerprints': len(self._fingerprints),
+            'history_entries': len(self._history),
+            'progress_entries': len(self._progress),
+            'store_samples': sum(len(fam) for fam in self._store),
+        }
+
     def refresh(self) -> None:
         '''
         Triggers a refresh by sending a command ("c:") to the server if the refresh interval has passed.
         '''
-        if self._connected and self._ts_last_query < datetime.datetime.utcnow() - datetime.timedelta(seconds=self._config.refresh_interval_seconds):
+        if not self._connected:
+            return
+        now = datetime.datetime.utcnow()
+        if self._ts_last_query < now - datetime.timedelta(seconds=self.query_interval):
             if self._in_flight:
                 self._log.warning('Waiting for a query to return')
             else:
-                self._ts_last_query = datetime.datetime.utcnow()
-                self.write_command('c', 'c:')
+                self._ts_last_query = now
+                self.send_query('c:')
+        elif self._in_flight:
+            return
+        elif self._progress_queue:
+            self.send_query(f'c:{self._progress_queue.pop(0)}', QUERY_PROGRESS)
+        elif self.running and self._config.progress_interval_seconds > 0 \
+                and self._ts_last_progress < now - datetime.timedelta(seconds=self._config.progress_interval_seconds):
+            self.queue_progress()
+            self.send_query(f'c:{self._progress_queue.pop(0)}', QUERY_PROGRESS)
+        elif self._config.heartbeat_interval_seconds > 0 \
+                and self._ts_query_sent < now - datetime.timedelta(seconds=self._config.heartbeat_interval_seconds):
+            self._log.debug('Sending heartbeat')
+            self.send_query('j:pretty-print-off', QUERY_HEARTBEAT)
+
+    def schedule_progress(self) -> None:
+        '''
+        Starts a round of progress queries if any client is running, otherwise drops the pending ones.
+        '''
+        if self.running and self._config.progress_interval_seconds > 0:
+            self.queue_progress()
+        else:
+            self._progress_queue = list()
 
-    def collect(self):
+    def queue_progress(self) -> None:
         '''
-        Custom collector endpoint.
+        Starts a round of progress queries, one for each running client.
         '''
-        self._log.debug(f'collect() with {len(self._clients)} clients')
-        burp_last_contact = GaugeMetricFamily('burp_last_contact', 'Time when the burp server was last contacted', labels=['server'])
-        burp_last_contact.add_metric([self.name], self._ts_last_query.replace(tzinfo=datetime.timezone.utc).timestamp())
-        yield burp_last_contact
+        self._ts_last_progress = datetime.datetime.utcnow()
+        self._progress_queue = sorted(self.running)
 
-        burp_up = GaugeMetricFamily('burp_up', 'Shows if the connection to the server is up', labels=['server'])
-        burp_up.add_metric([self.name], 1 if self._connected else 0)
-        yield burp_up
+    @property
+    def running(self) -> Set[str]:
+        '''
+        Names of the clients that were running at the last refresh, including those of the views.
+        '''
+        if not self._views:
+            return self._running
+        return self._running.union(*(view._running for view in self._views))
 
-        burp_parse_errors = CounterMetricFamily('burp_parse_errors', 'Amount of time parsing the server response failed', labels=['server'])
-        burp_parse_errors.add_metric([self.name], self._parse_errors)
-        yield burp_parse_errors
+    def send_query(self, data: str, kind: str = QUERY_LIST) -> None:
+        '''
+        Sends a query and marks it as in flight, see :func:`~burp_exporter.client.Client.check_deadline`.
 
-        burp_clients = GaugeMetricFamily('burp_clients', 'Number of clients known to the server', labels=['server'])
-        burp_clients.add_metric([self.name], len(self._clients))
-        yield burp_clients
+        :param data: The query to send.
+        :param kind: Kind of query, one of the ``QUERY_*`` constants. Determines how the answer is handled.
+        '''
+        self._ts_query_sent = datetime.datetime.utcnow()
+        self._in_flight = True
+        self._query_kind = kind
+        if self._recorder:
+            self._recorder.record(self.name, KIND_QUERY, f'{kind}:{data}'.encode('utf-8'))
+        try:
+            self.write_command('c', data)
+        except OSError as e:
+            self._log.warning(f'Error while sending query, assuming loss of connection: {str(e)}')
+            self.teardown_socket()
+
+    def check_deadline(self) -> bool:
+        '''
+        Tears down the connection if the query in flight did not receive an answer within the response timeout.
+
+        :return: True if the deadline was exceeded.
+        '''
+        if self._in_flight and self._ts_query_sent < datetime.datetime.utcnow() - datetime.timedelta(seconds=self._config.response_timeout_seconds):
+            self._log.warning(f'No answer within {self._config.response_timeout_seconds} seconds, assuming loss of connection')
+            self._timeouts += 1
+            self.teardown_socket()
+            return True
+        return False
+
+    @property
+    def store(self) -> MetricStore:
+        '''
+        Returns the metric store, after updating the server-level families.
+        '''
+        self._fam_last_contact.set(self._ts_last_query.replace(tzinfo=datetime.timezone.utc).timestamp())
+        self._fam_up.set(1 if self.connected else 0)
+        self._fam_parse_errors.set(self._parse_errors)
+        self._fam_timeouts.set(self._timeouts)
+        self._fam_limit_exceeded.set(self._limit_exceeded)
+        self._fam_refresh_interval.set(self._interval)
+        self._fam_clients.set(len(self._clients))
+        return self._store
+
+    def collect(self):
+        '''
+        Custom collector endpoint.
+        '''
+        self._log.debug('collect() with %d clients', len(self._clients))
+        for family in self.store:
+            yield family.to_metric()
+
+    def update_store(self, changed: Optional[Set[str]] = None, removed: Optional[Set[str]] = None) -> None:
+        '''
+        Rebuilds the per-client families of the metric store and the client snapshot from the list of clients.
 
-        cl_backup_num = GaugeMetricFamily('burp_client_backup_num', 'Number of the most recent completed backup for a client', labels=['server', 'name'])
-        cl_backup_ts = GaugeMetricFamily('burp_client_backup_timestamp', 'Timestamp of the most recent backup', labels=['server', 'name'])
-        cl_backup_has_in_progress = GaugeMetricFamily('burp_client_backup_has_in_progress', 'Indicates whether a backup with flag "working" is present', labels=['server', 'name'])
-        cl_run_status = GaugeMetricFamily('burp_client_run_status', 'Current run status of the client', labels=['server', 'name', 'run_status'])
+        :param changed: Names of the clients whose data changed since the last update, None if all changed.
+        :param removed: Names of the clients that were removed since the last update.
+        '''
+        names: List[str] = list()
+        backup_names: List[str] = list()
+        backup_num: List[float] = list()
+        backup_ts: List[float] = list()
+        in_progress: List[float] = list()
+        status_names: List[str] = list()
+        status_values: List[float] = list()
+        status_labels: List[Tuple[str, ...]] = list()
+        active = False
+        running: Set[str] = set()
+        changed_clients: List[ClientInfo] = list()
 
         for clnt in self._clients:
             has_working = False
 
             for b in clnt.backups:
                 if 'current' in b.flags:
-                    cl_backup_num.add_metric([self.name, clnt.name], b.number)
-                    cl_backup_ts.add_metric([self.name, clnt.name], b.timestamp)
+                    backup_names.append(clnt.name)
+                    backup_num.append(b.number)
+                    backup_ts.append(b.timestamp)
                 elif 'working' in b.flags:
                     # TODO figure out what to do
                     has_working = True
                 # TODO logs
-            cl_backup_has_in_progress.add_metric([self.name, clnt.name], 1 if has_working else 0)
-            cl_run_status.add_metric([self.name, clnt.name, 'running'], clnt.run_status == 'running')
-            cl_run_status.add_metric([self.name, clnt.name, 'idle'], clnt.run_status == 'idle')
+            if has_working or clnt.run_status == 'running':
+                active = True
+            if clnt.run_status == 'running':
+                running.add(clnt.name)
+            if changed is None or clnt.name in changed:
+                changed_clients.append(clnt)
+            names.append(clnt.name)
+            in_progress.append(1 if has_working else 0)
+            status_names += [clnt.name, clnt.name]
+            status_values += [1 if clnt.run_status == 'running' else 0, 1 if clnt.run_status == 'idle' else 0]
+            status_labels += [('running',), ('idle',)]
+
+        self._fam_backup_num.replace(backup_names, backup_num)
+        self._fam_backup_ts.replace(backup_names, backup_ts)
+        self._fam_has_in_progress.replace(names, in_progress)
+        self._fam_run_status.replace(status_names, status_values, extra=status_labels)
+        self._updates += 1
+        self._snapshot = self._snapshot.update(self._updates, self._clients, set(names) if changed is None else changed)
+        self.update_history(changed)
+        for clnt in changed_clients:
+            self._aggregates.update(clnt)
+        for name in removed or set():
+            self._aggregates.remove(name)
+        if self._sla is not None:
+            self._sla.update(changed_clients, removed or set(), time.time())
+            overdue = self._sla.overdue
+            self._fam_overdue.replace(names, [1 if n in overdue else 0 for n in names])
+            self._fam_overdue_count.set(len(overdue))
+            self._aggregates.set_overdue(overdue)
+            self._fam_label_overdue.replace(**self._aggregates.columns(self._aggregates.overdue))
+        self._fam_label_clients.replace(**self._aggregates.columns(self._aggregates.clients))
+        self._fam_label_running.replace(**self._aggregates.columns(self._aggregates.running))
+        self._store.prune(set(names))
+        self.adapt_interval(active)
+
+        # clients that returned to idle lose their progress metrics
+        self._running = running
+        self._progress = {k: v for k, v in self._progress.items() if k in running}
+        self.update_progress_store()
+        # with a shared connection, fan_out() schedules once all views are up to date
+        if self._primary is None and not self._views:
+            self.schedule_progress()
+
+    def update_history(self, changed: Optional[Set[str]] = None) -> None:
+        '''
+        Records new backups and run status changes of the clients whose data changed, and rebuilds the families derived
+        from the history of all clients.
 
-        yield cl_backup_num
-        yield cl_backup_ts
-        yield cl_backup_has_in_progress
-        yield cl_run_status
+        :param changed: Names of the clients whose data changed since the last update, None if all changed.
+        '''
+        now = time.time()
+        history: Dict[str, ClientHistory] = dict()
+        exp_names: List[str] = list()
+        exp_values: List[float] = list()
+        names: List[str] = list()
+        missed: List[float] = list()
+        age: List[float] = list()
+
+        for clnt in self._clients:
+            hist = self._history.get(clnt.name)
+            if hist is None or changed is None or clnt.name in changed:
+                if hist is None:
+                    hist = ClientHistory(self._config.history_size)
+                for ts in sorted(b.timestamp for b in clnt.backups if 'working' not in b.flags):
+                    hist.add_backup(ts)
+                hist.set_status(clnt.run_status, now)
+            history[clnt.name] = hist
+
+            expected = hist.expected_next()
+            if expected is not None:
+                exp_names.append(clnt.name)
+                exp_values.append(expected)
+            names.append(clnt.name)
+            missed.append(hist.missed(now))
+            age.append(hist.status_age(now) or 0.0)
+
+        # clients that were removed from the server lose their history
+        self._history = history
+        self._fam_backup_expected.replace(exp_names, exp_values)
+        self._fam_backup_missed.replace(names, missed)
+        self._fam_status_age.replace(names, age)
+
+    def update_progress_store(self) -> None:
+        '''
+        Rebuilds the progress families of the metric store. This only touches running clients.
+        '''
+        names = sorted(self._progress)
+        progress = [self._progress[n] for n in names]
+        self._fam_progress_phase.replace(names, [1] * len(names), extra=[(p.phase,) for p in progress])
+        self._fam_progress_files.replace(names, [p.files for p in progress])
+        self._fam_progress_files_est.replace(names, [p.files_estimated for p in progress])
+        self._fam_progress_bytes.replace(names, [p.bytes for p in progress])
+        self._fam_progress_bytes_est.replace(names, [p.bytes_estimated for p in progress])
+        self._fam_progress_ratio.replace(names, [p.ratio for p in progress])
+        tp_names: List[str] = list()
+        tp_values: List[float] = list()
+        for name, p in zip(names, progress):
+            if p.throughput is not None:
+                tp_names.append(name)
+                tp_values.append(p.throughput)
+        self._fam_throughput.replace(tp_names, tp_values)
+
+    def parse_progress(self, message: dict) -> None:
+        '''
+        Parses the answer to a ``c:<client>`` query for a running client and updates its progress. Unlike
+        :func:`~burp_exporter.client.Client.parse_message`, this leaves the list of clients alone.
+        '''
+        now = time.time()
+        for entry in message.get('clients', []):
+            name = entry.get('name')
+            if name not in self._running:
+                continue
+            progress = parse_progress(entry, now) if entry.get('run_status') == 'running' else None
+            if progress is None:
+                self._progress.pop(name, None)
+                continue
+            previous = self._progress.get(name)
+            if previous is not None:
+                progress.follow(previous)
+            self._progress[name] = progress
+        self.update_progress_store()
 
     def setup_socket(self) -> None:
         '''
@@ -133,7 +549,9 @@ class Client:
             self._log.debug(f'Creating socket: {self._config.burp_host}:{self._config.burp_port}')
             self._connected = False
             sck = sock.socket(sock.AF_INET, sock.SOCK_STREAM)
-            sck.setblocking(True)
+            # bounds the TCP connect and the TLS handshake, see connect() for the burp handshake
+            sck.settimeout(self._config.connect_timeout_seconds)
+            self.setup_keepalive(sck)
             try:
                 sck.connect((self._config.burp_host, self._config.burp_port))
             except ConnectionRefusedError:
@@ -156,16 +574,36 @@ class Client:
             ssl.match_hostname(cert, self._config.burp_cname)
             self._log.debug('Socket setup done')
 
+    def setup_keepalive(self, sck: sock.socket) -> None:
+        '''
+        Enables TCP keepalive on the socket, so the kernel detects peers that vanished without closing the connection.
+        The timing options are only available on some platforms and are skipped where they are missing.
+        '''
+        if self._config.tcp_keepalive_idle_seconds <= 0:
+            return
+        sck.setsockopt(sock.SOL_SOCKET, sock.SO_KEEPALIVE, 1)
+        for opt, value in [('TCP_KEEPIDLE', self._config.tcp_keepalive_idle_seconds),
+                           ('TCP_KEEPINTVL', self._config.tcp_keepalive_interval_seconds),
+                           ('TCP_KEEPCNT', self._config.tcp_keepalive_count)]:
+            if hasattr(sock, opt):
+                sck.setsockopt(sock.IPPROTO_TCP, getattr(sock, opt), value)
+
     def teardown_socket(self) -> None:
         '''
         Closes the socket and frees it.
         '''
         self._connected = False
         self._in_flight = False
-        self._buf = b''
+        self._query_kind = QUERY_LIST
+        self._progress_queue = list()
+        self.clear_buffer()
         if self._socket:
             # TODO flush buffers?
-            self._socket.shutdown(sock.SHUT_RDWR)
+            try:
+                self._socket.shutdown(sock.SHUT_RDWR)
+            except OSError as e:
+                # the peer may already be gone
+                self._log.debug(f'Error during shutdown: {str(e)}')
             self._socket.close()
             del self._socket
             self._socket = None
@@ -190,23 +628,120 @@ class Client:
         '''
         Reads data from the socket. The function assumes that data is available and will block if not, so make sure to
         use `select`. Up to `bufsize` bytes are read. If more data is available, call it again until everything is
-        received. If the end of the data is detected, calls the parser on it.
+        received. The data is handed to :func:`~burp_exporter.client.Client.receive`.
 
         :param bufsize: Amount of bytes that are read from the socket at once.
         '''
         if not self._socket:
             raise IOError('No socket')
-        rec_data = self._socket.read(bufsize)
+        try:
+            rec_data = self._socket.read(bufsize)
+        except OSError as e:
+            # includes errors reported by TCP keepalive, such as ETIMEDOUT
+            self._log.warning(f'Error while reading, assuming loss of connection: {str(e)}')
+            self.teardown_socket()
+            return
         reclen = len(rec_data)
         if reclen == 0:
             self._log.warning('Received no data, assuming loss of connection.')
             self.teardown_socket()
         else:
-            self._log.debug(f'Read {reclen} bytes')
-            self._buf += rec_data
-            if reclen < bufsize:
-                self.handle_data()
-                self._in_flight = False
+            self._log.debug('Read %d bytes', reclen)
+            self.receive(rec_data)
+
+    def receive(self, data: bytes) -> bool:
+        '''
+        Appends `data` received from the server to the buffer. Each answer of the server ends with the frame
+        ``c0001\\n``, which usually arrives in a read of its own. Once it is received, the answer is handled and the
+        next query may be sent.
+
+        :param data: The received data.
+        :return: Whether the data completed an answer.
+        '''
+        end = 0
+        try:
+            try:
+                end = self.buffer(data)
+            finally:
+                if self._recorder:
+                    self._recorder.record(self.name, KIND_COMPLETE if end else KIND_PARTIAL, data)
+            if not end:
+                return False
+
+            answer = self._buf
+            if end < len(answer):
+                # nothing else is in flight, so this can't belong to another answer
+                self._log.warning('Discarding %d bytes received after the end of the answer', len(answer) - end)
+                del answer[end:]
+            self.clear_buffer()
+            if self._query_kind == QUERY_HEARTBEAT:
+                self._log.debug('Received heartbeat answer')
+            else:
+                self.handle_data(answer)
+        except ReceiveLimitError as e:
+            self._limit_exceeded += 1
+            self._log.warning(f'{str(e)}, dropping the connection')
+            self.teardown_socket()
+            return False
+        except (ProtocolError, ValueError) as e:
+            # covers json and unicode decode errors, the stream can't be trusted to be in sync after them
+            self._parse_errors += 1
+            self._log.warning(f'Could not parse answer: {str(e)}, dropping the connection')
+            self.teardown_socket()
+            return False
+        self._in_flight = False
+        # continue with queued progress queries right away
+        self.refresh()
+        return True
+
+    def buffer(self, data: bytes) -> int:
+        '''
+        Appends `data` to the receive buffer. The header of each frame is checked as soon as it is received, so an
+        oversized frame is rejected before its payload is buffered.
+
+        :return: The length of the answer if the buffer holds the frame ending it, otherwise 0.
+        :raises ReceiveLimitError: If the buffer or a frame exceeds its limit.
+        :raises ProtocolError: If a frame header is malformed.
+        '''
+        if len(self._buf) + len(data) > self._config.receive_buffer_max_bytes:
+            raise ReceiveLimitError(f'Answer exceeds {self._config.receive_buffer_max_bytes} bytes')
+        # a bytearray grows in place, whereas concatenating bytes copies the whole buffer for every chunk
+        self._buf += data
+        buf = self._buf
+        while self._scan + 5 <= len(buf):
+            if buf[self._scan] not in b'cw':
+                raise ProtocolError(f'Unexpected message type {chr(buf[self._scan])}')
+            try:
+                mlen = self.frame_length(buf, self._scan)
+            except ValueError as e:
+                raise ProtocolError('Invalid length in message') from e
+            end = self._scan + 5 + mlen
+            if end > len(buf):
+                break
+            if buf[self._scan:end] == TERMINATOR:
+                return end
+            self._scan = end
+        return 0
+
+    def clear_buffer(self) -> None:
+        '''
+        Discards the content of the receive buffer.
+        '''
+        self._buf = bytearray()
+        self._scan = 0
+
+    def frame_length(self, buf: bytearray, pos: int) -> int:
+        '''
+        Returns the payload length announced by the header of the frame starting at `pos` in `buf`. The header
+        consists of the message type followed by the length as four hex digits.
+
+        :raises ValueError: If the length is not a hex number.
+        :raises ReceiveLimitError: If the length exceeds ``receive_frame_max_bytes``.
+        '''
+        mlen = int(buf[pos + 1:pos + 5], 16)
+        if mlen > self._config.receive_frame_max_bytes:
+            raise ReceiveLimitError(f'Frame of {mlen} bytes exceeds {self._config.receive_frame_max_bytes} bytes')
+        return mlen
 
     def raw_read(self, bufsize: int = 2048) -> Optional[str]:
         '''
@@ -214,9 +749,9 @@ class Client:
         '''
         if not self._socket:
             raise IOError('No socket')
-        data = b''
+        data = bytearray()
         while 1:
-            r, _, _ = select.select([self._socket], [], [], 10)
+            r, _, _ = select.select([self._socket], [], [], self._config.connect_timeout_seconds)
             if self._socket not in r:
                 self._log.debug('raw_read: timeout elapsed')
                 break
@@ -226,7 +761,12 @@ class Client:
                 self._log.warning('Received no data, but socket indicated read readiness. Closing')
                 self.teardown_socket()
                 break
-            self._log.debug(f'Read {reclen} bytes')
+            self._log.debug('Read %d bytes', reclen)
+            if self._recorder:
+                self._recorder.record(self.name, KIND_HANDSHAKE, rec_data)
+            if len(data) + reclen > self._config.receive_buffer_max_bytes:
+                self._limit_exceeded += 1
+                raise ReceiveLimitError(f'Handshake data exceeds {self._config.receive_buffer_max_bytes} bytes')
             data += rec_data
             if reclen < bufsize:
                 break
@@ -296,83 +836,146 @@ class Client:
         # from now on, there will be a message '\n' after every message from the server. This only happens after json
         # pretty printing was turned on.
         self.raw_read()
+        # the socket is only read once select() reports data from now on
+        self._socket.settimeout(None)
         self._connected = True
 
-    def handle_data(self) -> None:
-        '''
-        Takes data read from the socket and tries to make sense of it. If the payload can be parsed as json, it is
-        handed over to :func:`~burp_exporter.daemon.Daemon.parse_message`, which takes it from there.
-        One special case is the message ``c0001\n`` that is handed over from burp at the end of each message after
-        json pretty printing has been turned off. If that value is found, it is discarded silently.
-        '''
-        buf = self._buf.decode('utf8')
-        if buf[0] not in ['c', 'w']:
-            raise IOError(f'Unexpected code {buf[0]} in message {buf}')
-        # split into messages if we received multiple
-        while True:
-            mtype = buf[0]
-            dlen = len(buf)
-            # when using 'j:pretty-print-off', an empty message is sent. swallow it
-            if dlen == 6 and buf == 'c0001\n':
-                break
-            if dlen < 5:
-                raise Exception('Message too short')
+    def handle_data(self, buf: bytearray) -> None:
+        '''
+        Takes an answer read from the socket and tries to make sense of it. burp splits answers into frames of at most
+        65535 bytes, so the payloads of the ``c`` frames are joined and decoded as json at once. The result is handed
+        over to :func:`~burp_exporter.client.Client.fan_out`, which takes it from there. The frame ``c0001\\n`` that
+        ends each answer only adds whitespace to the payload, and an answer consisting of nothing else is discarded
+        silently. Warnings sent in ``w`` frames are logged.
+        '''
+        if not buf or chr(buf[0]) not in ['c', 'w']:
+            raise ProtocolError(f'Unexpected code {chr(buf[0]) if buf else None} in message {payload(bytes(buf))}')
+        data = bytearray()
+        pos = 0
+        while pos < len(buf):
+            mtype = chr(buf[pos])
+            if len(buf) - pos < 5:
+                raise ProtocolError('Message too short')
             try:
-                mlen = int(buf[1:5], 16)
+                mlen = self.frame_length(buf, pos)
             except ValueError as e:
-                raise Exception('Invalid length in message') from e
-            if not dlen == mlen + 5:
-                raise Exception(f'Expected {mlen} payload length, but got {dlen - 5}')
+                raise ProtocolError('Invalid length in message') from e
+            end = pos + 5 + mlen
+            if end > len(buf):
+                raise ProtocolError(f'Expected {mlen} payload length, but got {len(buf) - pos - 5}')
 
-            mdata = buf[5:mlen + 5]
             if mtype == 'c':
-                try:
-                    json_data = json.loads(mdata)
-                except json.JSONDecodeError as e:
-                    self._log.warning('Could not decode data: ' + str(e))
-                    raise
-                self.parse_message(json_data)
+                data += buf[pos + 5:end]
             elif mtype == 'w':
-                self._log.warning(f'Got warning: {mdata}')
+                self._log.warning('Got warning: %s', payload(buf[pos + 5:end].decode('utf8')))
             else:
-                raise Exception(f'Unexpected message type {mtype}')
+                raise ProtocolError(f'Unexpected message type {mtype}')
+            pos = end
+        self._log.debug('end of data')
+        # when using 'j:pretty-print-off', an empty message is sent. swallow it
+        if not data.strip():
+            return
+        try:
+            json_data = json.loads(data.decode('utf8'))
+        except json.JSONDecodeError as e:
+            raise ProtocolError(f'Could not decode data: {str(e)}') from e
+        self.fan_out(json_data)
+
+    def fan_out(self, message: dict) -> None:
+        '''
+        Hands a message received for the query in flight to this client and to the views sharing its connection. The
+        message is decoded once, and clients validated for one view are reused by the others.
+        '''
+        validated: Dict[int, Tuple[bytes, Optional[ClientInfo]]] = dict()
+        for view in [self] + self._views:
+            if self._query_kind == QUERY_PROGRESS:
+                # progress of clients the view does not know about is skipped
+                view.parse_progress(message)
+            else:
+                view._ts_last_query = self._ts_last_query
+                view.parse_message(view.filter_message(message), validated)
+        if self._query_kind != QUERY_PROGRESS and self._views:
+            self.schedule_progress()
 
-            data = buf[mlen + 5:-1]
-            if len(data) < 1:
-                self._log.debug('end of data')
-                break
-        self._buf = b''
+    def filter_message(self, message: dict) -> dict:
+        '''
+        Returns `message` with the ``clients`` list reduced to the clients matching ``include_clients``. Entries
+        without a name are kept, so they are reported by validation.
+        '''
+        patterns = self._config.include_clients
+        if not patterns or not isinstance(message.get('clients'), list):
+            return message
+
+        def included(client) -> bool:
+            if not isinstance(client, dict) or not isinstance(client.get('name'), str):
+                return True
+            return any(fnmatch.fnmatchcase(client['name'], pattern) for pattern in patterns)
 
-    def parse_message(self, message: dict) -> None:
+        clients = [client for client in message['clients'] if included(client)]
+        return dict(message, clients=clients)
+
+    def parse_message(self, message: dict, validated: Optional[Dict[int, Tuple[bytes, Optional[ClientInfo]]]] = None) -> None:
         '''
         Parses a json message received from the server. Right now, only the ``clients`` list is understood, everything
         else raises an exception.
+
+        :param validated: Fingerprints and validation results of the entries parsed for another view of the same
+            message, by ``id`` of the entry. None marks an entry that failed validation, it is counted as a parse error
+            by every view that includes it, but reported only once. Entries validated here are added to it.
         '''
-        self._log.debug(f'parse_message: {message}')
+        debug = self._log.isEnabledFor(logging.DEBUG)
+        if debug:
+            self._log.debug('parse_message: %s', payload(message))
         if 'clients' in message:
+            previous = {cl.name: cl for cl in self._clients}
             clients: Set[str] = set()
+            changed: Set[str] = set()
+            new_list: List[ClientInfo] = list()
             for client in message['clients']:
-                try:
-                    info = ClientInfo(**client)
-                except ValidationError as e:
-                    self._log.warning(f'Validation error: {str(e)}')
-                    self._parse_errors += 1
+                name = client.get('name') if isinstance(client, dict) else None
+                cached = validated.get(id(client)) if validated is not None else None
+                digest = cached[0] if cached is not None else fingerprint(client)
+                if isinstance(name, str) and name in previous and self._fingerprints.get(name) == digest:
+                    # unchanged since the last refresh, no need to validate it again
+                    info = previous[name]
+                elif cached is not None:
+                    if cached[1] is None:
+                        self._parse_errors += 1
+                        continue
+                    info = cached[1]
+                    changed.add(info.name)
+                    self._fingerprints[info.name] = digest
                 else:
+                    try:
+                        info = ClientInfo(**client)
+                    except (TypeError, ValidationError) as e:
+                        self._log.warning(f'Validation error: {str(e)}')
+                        self._parse_errors += 1
+                        if validated is not None:
+                            validated[id(client)] = (digest, None)
+                        continue
                     # TODO validate name
+                    if debug and full_payloads():
+                        self._log.debug('%s client: %s', 'Updating' if info.name in previous else 'New', info.name)
+                    changed.add(info.name)
+                    self._fingerprints[info.name] = digest
+                if validated is not None and cached is None:
+                    validated[id(client)] = (digest, info)
+                if info.name not in clients:
                     clients.add(info.name)
-                    if info.name not in self._clients:
-                        self._log.debug(f'New client: {info.name}')
-                        self._clients.append(info)
-                    else:
-                        self._log.debug(f'Updating client: {info.name}')
-                        # TODO meditate over performance
-                        self._clients = [info if cl.name == info.name else cl for cl in self._clients]
-
-            self._log.debug(f'List before cleanup: {self._clients} | {clients}')
-            # compile a list of clients that are no longer included in the server response
-            self._clients = [x for x in self._clients if x.name in clients]
-            self._log.debug(f'List after cleanup: {self._clients}')
+                    new_list.append(info)
+
+            # clients that are no longer included in the server response are dropped
+            removed = set(previous) - clients
+            for name in removed:
+                self._fingerprints.pop(name, None)
+            self._clients = new_list
+            if debug:
+                self._log.debug('parse_message: %d clients, %d new or changed, %d removed', len(new_list), len(changed), len(removed))
+                if full_payloads():
+                    self._log.debug('Removed clients: %s', payload(sorted(removed)))
+            self.update_store(changed, removed)
 
         else:
-            self._log.warning(f'Unknown message: {message}')
-            raise Exception('Unknown data')
+            self._log.warning('Unknown message: %s', payload(message))
+            raise ProtocolError('Unknown data')
@@ -1,15 +1,22 @@
 
+import concurrent.futures
 import datetime
 import logging
 import os
 import select
 import signal
+import time
 import yaml
 from prometheus_client import CollectorRegistry, Gauge, MetricsHandler, generate_latest
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from .client import Client
+from .loopmonitor import LoopMonitor
+from .recorder import Recorder
+from .sla import SlaPolicy
 from .handler import start_http_server
+from .store import render
+from .textfile import TextfileWriter
 from .types import ClientSettings
 
 log = logging.getLogger('burp_exporter.daemon')
@@ -32,13 +39,47 @@ class ConfigError(Exception):
     pass
 
 
+#: Settings that identify a connection, entries that share one must agree on them
+CONNECTION_IDENTITY = ('burp_host', 'burp_port', 'cname', 'password', 'burp_cname', 'tls_ca_cert', 'tls_cert', 'tls_key',
+                       'version')
+#: Settings that only the entry owning a shared connection applies
+CONNECTION_SETTINGS = ('connect_timeout_seconds', 'response_timeout_seconds', 'heartbeat_interval_seconds', 'tcp_keepalive_idle_seconds',
+                       'tcp_keepalive_interval_seconds', 'tcp_keepalive_count', 'receive_buffer_max_bytes',
+                       'receive_frame_max_bytes', 'progress_interval_seconds')
+
+
+def watchdog_interval() -> Optional[float]:
+    '''
+    Returns the interval in which systemd expects ``WATCHDOG=1`` notifications (half of ``WATCHDOG_USEC``), or None if
+    the watchdog is not enabled for this process.
+    '''
+    usec = os.environ.get('WATCHDOG_USEC')
+    pid = os.environ.get('WATCHDOG_PID')
+    if not usec or (pid and pid != str(os.getpid())):
+        return None
+    try:
+        return int(usec) / 1e6 / 2
+    except ValueError:
+        log.warning(f'Invalid WATCHDOG_USEC: {usec}')
+        return None
+
+
 class Daemon:
 
-    def __init__(self, cfg_file: str, timeout: int = 5):
+    def __init__(self, cfg_file: str, timeout: int = 5, record: Optional[str] = None):
         log.info('Starting up')
 
+        # records the data received from all servers if set
+        self._recorder: Optional[Recorder] = Recorder(record) if record else None
+
         self._clients = list()  # type: List[Client]
         self._registry = CollectorRegistry()
+        self._serve_http = True
+        self._stall_threshold: float = 5
+        self._debug_bind: Optional[Tuple[str, int]] = None
+        self._textfile: Optional[TextfileWriter] = None
+        # state of each client when its textfile was last written, as (updates, connected)
+        self._textfile_state: Dict[str, Tuple[int, bool]] = dict()
 
         cfg_path = os.path.expanduser(cfg_file)
         if not os.path.exists(cfg_path):
@@ -53,19 +94,35 @@ class Daemon:
             log.critical(f'Error during config parsing: {str(e)}')
             raise
 
-        self._timeout = timeout
+        self._timeout: float = timeout
+
+        # the select timeout must not delay the watchdog notifications
+        self._watchdog_interval = watchdog_interval() if HAVE_SYSTEMD else None
+        self._watchdog_last = 0.0
+        if self._watchdog_interval is not None:
+            log.info(f'Systemd watchdog enabled, notifying every {self._watchdog_interval} seconds')
+            self._timeout = min(self._timeout, self._watchdog_interval)
 
         # set to true to stop the main loop
         self._stop = False
 
-        # sanity checks
-        if self._bind_port <= 1024 or self._bind_port > 65535:
-            log.error(f'bind_port is outside of range (1024, 65535), resetting to default')
-            self._bind_port = 9645
+        if self._serve_http:
+            # sanity checks
+            if self._bind_port <= 1024 or self._bind_port > 65535:
+                log.error(f'bind_port is outside of range (1024, 65535), resetting to default')
+                self._bind_port = 9645
 
-        # start monitoring endpoint
-        log.info(f'Binding monitoring to {self._bind_address}:{self._bind_port}')
-        start_http_server(addr=str(self._bind_address), port=self._bind_port)
+            # start monitoring endpoint
+            log.info(f'Binding monitoring to {self._bind_address}:{self._bind_port}')
+            start_http_server(addr=str(self._bind_address), port=self._bind_port)
+        else:
+            log.info('Not serving HTTP')
+
+        if self._debug_bind is not None:
+            log.warning(f'Binding debug endpoints to {self._debug_bind[0]}:{self._debug_bind[1]}')
+            # the debug endpoints are rarely enabled, don't load them (and tracemalloc) otherwise
+            from .debug import start_debug_server
+            start_debug_server(addr=self._debug_bind[0], port=self._debug_bind[1])
 
         if HAVE_SYSTEMD:
             log.info('Signaling readiness')
@@ -99,52 +156,135 @@ class Daemon:
     def registry(self) -> CollectorRegistry:
         return self._registry
 
+    @property
+    def textfile(self) -> Optional[TextfileWriter]:
+        return self._textfile
+
+    def write_textfiles(self) -> None:
+        '''
+        Writes the exposition of each client whose data was refreshed or whose connection state changed since the last
+        write to the textfile directory, if configured.
+        '''
+        if self._textfile is None:
+            return
+        for client in self._clients:
+            state = (client.updates, client.connected)
+            if self._textfile_state.get(client.name) == state:
+                continue
+            try:
+                self._textfile.write(client.name, render([client.store]))
+            except OSError as e:
+                log.error(f'Could not write textfile for {client}: {str(e)}')
+            else:
+                self._textfile_state[client.name] = state
+
+    def connect_client(self, client: Client) -> bool:
+        '''
+        Sets up the socket of `client` and performs the handshake, tearing down a previous socket first. Errors are
+        logged and leave the client disconnected.
+
+        :return: Whether the client is connected.
+        '''
+        if client.socket:
+            client.teardown_socket()
+        try:
+            client.setup_socket()
+        except ConnectionRefusedError:
+            log.warning(f'Connection refused for "{client}"')
+            client.teardown_socket()
+            return False
+        except OSError as e:
+            log.error(f'Error for {client} during socket setup: {str(e)}')
+            client.teardown_socket()
+            return False
+        try:
+            client.connect()
+        except IOError as e:
+            log.critical(f'Error for {client} during handshake: {str(e)}')
+            client.teardown_socket()
+            return False
+        return True
+
+    def connect_all(self) -> None:
+        '''
+        Connects to all servers, see :func:`~burp_exporter.daemon.Daemon.connect_clients`. Servers that fail are
+        retried by the main loop as usual.
+        '''
+        self.connect_clients([client for client in self._clients if client.primary is None and not client.connected])
+
+    def connect_clients(self, clients: List[Client]) -> None:
+        '''
+        Connects the `clients` concurrently, so the time until the first data is available is bound by the slowest
+        server instead of the sum of all handshakes. Each client is only touched by its own thread. While waiting, the
+        systemd watchdog is notified, as the handshakes are bound by ``connect_timeout_seconds`` but may take longer
+        than the watchdog interval in total.
+        '''
+        if not clients:
+            return
+        log.info('Connecting to %d servers', len(clients))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(clients), thread_name_prefix='connect') as pool:
+            futures = [pool.submit(self.connect_client, client) for client in clients]
+            pending = set(futures)
+            while pending:
+                _, pending = concurrent.futures.wait(pending, timeout=self._timeout)
+                self.notify_watchdog()
+            connected = sum(future.result() for future in futures)
+        log.info('Connected to %d of %d servers', connected, len(clients))
+
     def run(self) -> None:
         '''
         Daemon main loop. The loop wait is done using the select call in read(). Loops until _stop is False.
         '''
+        self.connect_all()
+        monitor = LoopMonitor(self._stall_threshold)
         while not self._stop:
             log.debug('begin main loop')
+            monitor.start()
             sockets = list()
+            reconnect: List[Client] = list()
             for client in self._clients:
                 burp_last_contact.labels(client.name).set(client.last_query.replace(tzinfo=datetime.timezone.utc).timestamp())
                 burp_up.labels(client.name).set(client.connected)
                 burp_clients.labels(client.name).set(client.client_count)
+                if client.primary is not None:
+                    # uses the connection of its primary
+                    continue
                 if not client.connected:
                     if client.last_connect_attempt < datetime.datetime.utcnow() - datetime.timedelta(minutes=1):
-                        log.debug(f'Last connection attempt for {client} was {client.last_connect_attempt}')
-                        if client.socket:
-                            client.teardown_socket()
-                        try:
-                            client.setup_socket()
-                        except ConnectionRefusedError:
-                            log.warning(f'Connection refused for "{client}"')
-                            client.teardown_socket()
-                        else:
-                            try:
-                                client.connect()
-                            except IOError as e:
-                                log.critical(f'Error for {client} during handshake: {str(e)}')
-                                client.teardown_socket()
+                        log.debug('Last connection attempt for %s was %s', client, client.last_connect_attempt)
+                        reconnect.append(client)
                     else:
                         log.info(f'Client {client} has no connection')
 
-                else:
+                elif not client.check_deadline():
                     # print(generate_latest(client).decode('utf-8'))
-                    sockets.append(client.socket)
-                    client.refresh()
+                    with monitor.phase(client.name, 'refresh'):
+                        client.refresh()
+                    # a failed write tears down the socket, it must not be passed to select
+                    if client.connected and client.socket is not None:
+                        sockets.append(client.socket)
+
+            if reconnect:
+                with monitor.phase(reconnect[0].name if len(reconnect) == 1 else '', 'connect'):
+                    self.connect_clients(reconnect)
 
             log.debug('end main loop, sleeping')
             try:
-                r, _, _ = select.select(sockets, [], [], self._timeout)
-                log.debug(f'Checked for receive on {len(sockets)} clients')
+                with monitor.wait(self._timeout):
+                    r, _, _ = select.select(sockets, [], [], self._timeout)
+                log.debug('Checked for receive on %d clients', len(sockets))
                 for client in self._clients:
                     if client.socket in r:
-                        log.debug(f'Data available for {client}')
-                        client.read()
+                        log.debug('Data available for %s', client)
+                        with monitor.phase(client.name, 'read'):
+                            client.read()
+                with monitor.phase('', 'write_textfiles'):
+                    self.write_textfiles()
             except KeyboardInterrupt:
                 log.info('Got keyboard interrupt, shutting down')
                 self._stop = True
+            monitor.finish()
+            self.notify_watchdog()
 
         log.info('Shutting down')
         if HAVE_SYSTEMD:
@@ -152,6 +292,20 @@ class Daemon:
         # put cleanup code here
         for client in self._clients:
             client.teardown_socket()
+        if self._recorder:
+            self._recorder.close()
+
+    def notify_watchdog(self) -> None:
+        '''
+        Sends ``WATCHDOG=1`` to systemd if the watchdog is enabled and the notification is due. This is only called from
+        the main loop, so a hung loop results in systemd restarting the service.
+        '''
+        if self._watchdog_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._watchdog_last >= self._watchdog_interval:
+            systemd.daemon.notify('WATCHDOG=1')
+            self._watchdog_last = now
 
     def signal_handler(self, signum, frame) -> None:
         '''
@@ -170,6 +324,23 @@ class Daemon:
         else:
             log.warning(f'Got signal {signum}, ignoring')
 
+    @staticmethod
+    def check_shared(primary: ClientSettings, view: ClientSettings) -> None:
+        '''
+        Checks that `view` can share the connection of `primary`, see :data:`CONNECTION_IDENTITY`. Differing
+        :data:`CONNECTION_SETTINGS` are logged, as only those of `primary` apply.
+
+        :raises ConfigError: If the entries connect to the same server as the same client, but in different ways.
+        '''
+        differ = [name for name in CONNECTION_IDENTITY if getattr(primary, name) != getattr(view, name)]
+        if differ:
+            raise ConfigError(f'Client {view.name} connects to the same server as {primary.name} with the same cname, '
+                              f'but differs in {", ".join(differ)}')
+        ignored = [name for name in CONNECTION_SETTINGS if getattr(primary, name) != getattr(view, name)]
+        if ignored:
+            log.warning(f'Client {view.name} shares the connection of {primary.name}, its {", ".join(ignored)} '
+                        f'are ignored in favor of those of {primary.name}')
+
     def read_config(self) -> Tuple[str, int]:
         '''
         Reads the yaml config at the given `path`. It returns a tuple (bind_address, bind_port) and manages the list
@@ -183,14 +354,44 @@ class Daemon:
         with open(cfg_path, 'rt') as fh:
             cfg = yaml.safe_load(fh.read())
 
-        if 'bind_address' not in cfg:
-            raise ConfigError('bind port not found')
-        if 'bind_port' not in cfg:
-            raise ConfigError('bind_port not found')
+        self._serve_http = cfg.get('serve_http', True)
+        if self._serve_http:
+            if 'bind_address' not in cfg:
+                raise ConfigError('bind port not found')
+            if 'bind_port' not in cfg:
+                raise ConfigError('bind_port not found')
+
+        if cfg.get('textfile_directory'):
+            if not os.path.isdir(os.path.expanduser(cfg['textfile_directory'])):
+                raise ConfigError(f'textfile_directory {cfg["textfile_directory"]} is not a directory')
+            self._textfile = TextfileWriter(cfg['textfile_directory'])
+        else:
+            self._textfile = None
+        if not self._serve_http and self._textfile is None:
+            raise ConfigError('serve_http is disabled and no textfile_directory is set')
+
+        if 'debug_bind_port' in cfg:
+            debug_bind = (str(cfg.get('debug_bind_address', '127.0.0.1')), cfg['debug_bind_port'])
+            if self._serve_http and debug_bind == (str(cfg['bind_address']), cfg['bind_port']):
+                raise ConfigError('debug_bind_address and debug_bind_port must differ from bind_address and bind_port')
+            self._debug_bind = debug_bind
+        else:
+            self._debug_bind = None
+
+        self._stall_threshold = float(cfg.get('stall_threshold_seconds', 5))
+
+        sla: Optional[SlaPolicy] = None
+        if cfg.get('backup_sla'):
+            try:
+                sla = SlaPolicy.from_config(cfg['backup_sla'])
+            except ValueError as e:
+                raise ConfigError(f'Invalid backup_sla: {str(e)}') from e
 
         if 'clients' not in cfg:
             log.warning('No clients in config')
         else:
+            # entries connecting to the same server as the same client share one connection
+            connections: Dict[Tuple[str, int, str], Client] = dict()
             for c_conf in cfg['clients']:
                 if 'name' not in c_conf:
                     raise ConfigError('client missing name')
@@ -204,6 +405,15 @@ class Daemon:
                 # TODO error handling
                 cl_cfg = ClientSettings(**c_conf)
                 # self._clients.append(Client(cl_cfg))
-                self.add_client(Client(cl_cfg))
+                client = Client(cl_cfg, recorder=self._recorder, sla=sla)
+                key = (cl_cfg.burp_host, cl_cfg.burp_port, cl_cfg.cname)
+                if key in connections:
+                    primary = connections[key]
+                    self.check_shared(primary.config, cl_cfg)
+                    log.info(f'Client {client.name} shares the connection of {primary.name}')
+                    primary.attach(client)
+                else:
+                    connections[key] = client
+                self.add_client(client)
 
-        return cfg['bind_address'], cfg['bind_port']
+        return cfg.get('bind_address', '127.0.0.1'), cfg.get('bind_port', 9645)
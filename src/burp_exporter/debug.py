@@ -0,0 +1,167 @@
+
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler
+from types import FrameType
+from prometheus_client.exposition import _ThreadingSimpleServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from . import handler
+
+log = logging.getLogger('burp_exporter.debug')
+
+#: Upper limit for the duration of a profile
+MAX_PROFILE_SECONDS = 60
+#: Time between two samples of the profiler
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+# the snapshot taken during the previous call to /debug/memory, used for diffing
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def sample_stacks(seconds: float, interval: float = SAMPLE_INTERVAL_SECONDS) -> Dict[str, int]:
+    '''
+    Samples the stacks of all threads (except the calling one) for `seconds` seconds.
+
+    :return: Dict mapping the collapsed stacks (``thread;outer;...;inner``) to the number of times they were seen.
+    '''
+    own = threading.get_ident()
+    stacks: Dict[str, int] = collections.Counter()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, top in sys._current_frames().items():
+            if ident == own:
+                continue
+            frame: Optional[FrameType] = top
+            parts: List[str] = list()
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            parts.append(names.get(ident, str(ident)))
+            stacks[';'.join(reversed(parts))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def format_collapsed(stacks: Dict[str, int]) -> str:
+    '''
+    Formats the samples as collapsed stacks, suitable for ``flamegraph.pl``.
+    '''
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+
+def format_top(stacks: Dict[str, int], limit: int = 40) -> str:
+    '''
+    Formats the samples as a table of functions, sorted by the number of samples the function was on top of the stack
+    (``self``) and the number of samples it was anywhere on the stack (``total``).
+    '''
+    own: Dict[str, int] = collections.Counter()
+    total: Dict[str, int] = collections.Counter()
+    samples = sum(stacks.values())
+    for stack, count in stacks.items():
+        frames = stack.split(';')[1:]
+        if frames:
+            own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    lines = [f'{samples} samples\n', f'{"self":>8} {"total":>8}  function\n']
+    for func, _ in sorted(total.items(), key=lambda x: (own[x[0]], x[1]), reverse=True)[:limit]:
+        lines.append(f'{own[func]:8d} {total[func]:8d}  {func}\n')
+    return ''.join(lines)
+
+
+def memory_report(limit: int = 20) -> str:
+    '''
+    Returns a report containing the `limit` biggest allocation sites, the difference to the previous call and the
+    buffer and store sizes of each client. Tracing is started by
+    :func:`~burp_exporter.debug.start_debug_server`, or by the first call if it is not running.
+    '''
+    global _last_snapshot
+    lines: List[str] = list()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        lines.append('tracemalloc was not running, tracing started now\n\n')
+    with _snapshot_lock:
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(f'traced: {current} bytes, peak: {peak} bytes\n\n')
+
+        lines.append(f'Top {limit} allocations\n')
+        for stat in snapshot.statistics('lineno')[:limit]:
+            lines.append(f'{stat}\n')
+
+        if _last_snapshot is not None:
+            lines.append(f'\nTop {limit} differences since last call\n')
+            for diff in snapshot.compare_to(_last_snapshot, 'lineno')[:limit]:
+                lines.append(f'{diff}\n')
+        _last_snapshot = snapshot
+
+    if handler.DAEMON is not None:
+        lines.append('\nClients\n')
+        for clnt in handler.DAEMON.clients:
+            info = ', '.join(f'{k}={v}' for k, v in clnt.memory_info().items())
+            lines.append(f'{clnt.name}: {info}\n')
+    return ''.join(lines)
+
+
+class DebugHandler(BaseHTTPRequestHandler):
+    '''
+    Handler for the diagnostic endpoints. It is served on its own address, see
+    :func:`~burp_exporter.debug.start_debug_server`.
+    '''
+
+    def do_GET(self) -> None:
+        log.debug('do_GET %s', self.path)
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        try:
+            if url.path == '/debug/profile':
+                seconds = min(float(params.get('seconds', ['5'])[0]), MAX_PROFILE_SECONDS)
+                stacks = sample_stacks(seconds)
+                if params.get('format', ['collapsed'])[0] == 'top':
+                    output = format_top(stacks)
+                else:
+                    output = format_collapsed(stacks)
+            elif url.path == '/debug/memory':
+                output = memory_report(int(params.get('limit', ['20'])[0]))
+            else:
+                self.send_error(404, 'Endpoint not found')
+                return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.end_headers()
+        self.wfile.write(output.encode('utf-8'))
+
+    def log_message(self, format: str, *args) -> None:
+        log.debug(format, *args)
+
+
+def start_debug_server(port: int, addr: str = '127.0.0.1') -> None:
+    '''
+    Serves the diagnostic endpoints on `addr`:`port` and starts tracing memory allocations, so the first call to
+    ``/debug/memory`` already covers the allocations made since startup.
+    '''
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    httpd = _ThreadingSimpleServer((addr, port), DebugHandler)
+    t = threading.Thread(target=httpd.serve_forever, name='debug-http')
+    t.daemon = True
+    t.start()
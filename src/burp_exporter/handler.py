@@ -2,17 +2,87 @@
 
 import logging
 import threading
-from pkg_resources import get_distribution
-from prometheus_client import CollectorRegistry, generate_latest, MetricsHandler, CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry, Counter, generate_latest, MetricsHandler, CONTENT_TYPE_LATEST
 from prometheus_client.exposition import _ThreadingSimpleServer
 from prometheus_client.metrics_core import Metric
 from prometheus_client.utils import floatToGoString
-from typing import List, Optional
-from urllib.parse import parse_qs, urlparse
+from typing import Callable, Dict, Hashable, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+from .api import ApiError, parse_page_params
+from .store import render
+from .version import get_version
 
 DAEMON = None
 log = logging.getLogger('burp_exporter.handler')
 
+RENDERS_SAVED = Counter('burp_exporter_renders_saved', 'Renders saved by sharing the output of a concurrent identical request')
+
+
+class _Call:
+    '''
+    A render in progress, see :class:`~burp_exporter.handler.SingleFlight`.
+    '''
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: bytes = b''
+        self.error: Optional[Exception] = None
+
+
+class SingleFlight:
+    '''
+    Makes concurrent calls with the same key share a single execution: the first caller runs the function, callers
+    arriving while it runs wait for it and receive the same result (or exception).
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = dict()
+
+    def do(self, key: Hashable, func: Callable[[], bytes]) -> bytes:
+        '''
+        Runs `func`, unless a call with the same `key` is already in progress, in which case its result is returned.
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+        if not leader:
+            RENDERS_SAVED.inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+PROBE_RENDERS = SingleFlight()
+
+
+def render_probe(names: Optional[List[str]] = None) -> bytes:
+    '''
+    Renders the metrics of the servers in `names` (all servers if None). Identical concurrent requests share a single
+    render.
+    '''
+    if DAEMON is None:
+        raise Exception('No daemon')
+    daemon = DAEMON
+    key = ('text', tuple(sorted(set(names)))) if names is not None else ('text', None)
+    if names is None:
+        return PROBE_RENDERS.do(key, lambda: render([clnt.store for clnt in daemon.clients]))
+    return PROBE_RENDERS.do(key, lambda: render([clnt.store for clnt in daemon.clients if clnt.name in names]))
+
 
 def generate(registries: List[CollectorRegistry]) -> bytes:
     '''
@@ -86,49 +156,59 @@ def generate(registries: List[CollectorRegistry]) -> bytes:
 class BurpHandler(MetricsHandler):
 
     def do_GET(self) -> None:
-        log.debug(f'do_GET {self.path}')
+        log.debug('do_GET %s', self.path)
         path = urlparse(self.path).path
         params = parse_qs(urlparse(self.path).query)
         output: bytes = b''
+        content_type = CONTENT_TYPE_LATEST
         try:
             if path == '/':
                 self.send_welcome()
             elif DAEMON is None:
                 raise Exception('No daemon')
             elif path == '/probe':
-                if 'server[]' in params:
-                    names = params['server[]']
-                    registries: List[CollectorRegistry] = list()
-                    for clnt in DAEMON.clients:
-                        if clnt.name in names:
-                            registries.append(clnt.registry)
-                    output = generate(registries=registries)
-                else:
-                    output = generate(registries=[DAEMON.registry])
+                output = render_probe(params.get('server[]'))
             elif path == '/metrics':
                 output = generate_latest(self.registry)
+            elif path.startswith('/api/v1/servers/') and path.endswith('/clients'):
+                output = self.api_clients(unquote(path[len('/api/v1/servers/'):-len('/clients')]), params)
+                content_type = 'application/json'
             else:
                 self.send_error(404, 'Endpoint not found')
+        except ApiError as e:
+            self.send_error(e.status, str(e))
         except Exception as e:
             self.send_error(500, str(e))
         if output != b'':
             self.send_response(200)
-            self.send_header('Content-Type', CONTENT_TYPE_LATEST)
+            self.send_header('Content-Type', content_type)
             self.end_headers()
             self.wfile.write(output)
 
+    def api_clients(self, server: str, params: Dict[str, List[str]]) -> bytes:
+        '''
+        Returns a page of the clients of `server` as JSON, see :func:`~burp_exporter.api.ClientSnapshot.page`.
+        '''
+        if DAEMON is None:
+            raise Exception('No daemon')
+        for clnt in DAEMON.clients:
+            if clnt.name == server:
+                return clnt.snapshot.page(**parse_page_params(params))
+        raise ApiError(404, f'Unknown server {server}')
+
     def send_welcome(self) -> None:
         log.debug('send_welcome')
         self.send_response(200)
         self.send_header('Content-Type', 'text/html')
         self.end_headers()
         content = f'''<html><head><title>Burp Exporter</title></head><body>
-    <h1>Burp Exporter {get_distribution('burp_exporter').version}</h1>
+    <h1>Burp Exporter {get_version()}</h1>
 
     <ul>
         <li><a href="/metrics">/metrics</a> - state overview</a></li>
         <li><a href="/probe">/probe</a> - all information</li>
         <li>/probe?server[]=servername - limit by server</li>
+        <li>/api/v1/servers/servername/clients?fields=name,backups&amp;limit=100&amp;cursor=name&amp;since=refresh - clients as JSON</li>
     </ul>
 
 </body></html>'''
@@ -0,0 +1,123 @@
+
+import array
+from typing import List, Optional
+
+#: Fraction of the backup interval a backup may be late before it counts as missed
+MISSED_GRACE = 0.25
+
+
+class RingBuffer:
+    '''
+    Fixed size ring buffer of floats, backed by an `array.array`, so the memory footprint does not depend on the
+    number of values added.
+
+    :param size: Number of values retained.
+    '''
+
+    __slots__ = ('_data', '_next', '_count')
+
+    def __init__(self, size: int) -> None:
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        self._data = array.array('d', bytes(8 * size))
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, value: float) -> None:
+        self._data[self._next] = value
+        self._next = (self._next + 1) % len(self._data)
+        self._count = min(self._count + 1, len(self._data))
+
+    def last(self) -> Optional[float]:
+        if self._count == 0:
+            return None
+        return self._data[self._next - 1]
+
+    def values(self) -> List[float]:
+        '''
+        Returns the values, oldest first.
+        '''
+        if self._count < len(self._data):
+            return self._data[:self._count].tolist()
+        return self._data[self._next:].tolist() + self._data[:self._next].tolist()
+
+
+class ClientHistory:
+    '''
+    History of a single client across refreshes: the timestamps of its last backups and of its last run status
+    changes.
+
+    :param size: Number of backups and status changes retained.
+    '''
+
+    __slots__ = ('backups', 'status_changes', 'status')
+
+    def __init__(self, size: int) -> None:
+        #: Timestamps of the last backups
+        self.backups = RingBuffer(size)
+        #: Timestamps of the last run status changes
+        self.status_changes = RingBuffer(size)
+        #: Current run status
+        self.status: Optional[str] = None
+
+    def add_backup(self, timestamp: float) -> None:
+        '''
+        Records a backup, unless it is not newer than the last one recorded.
+        '''
+        last = self.backups.last()
+        if last is None or timestamp > last:
+            self.backups.append(timestamp)
+
+    def set_status(self, status: str, now: float) -> None:
+        '''
+        Records a status change if `status` differs from the current one.
+        '''
+        if status != self.status:
+            self.status = status
+            self.status_changes.append(now)
+
+    def interval(self) -> Optional[float]:
+        '''
+        Returns the usual time between two backups (the median of the recorded intervals), or None if fewer than two
+        backups are known.
+        '''
+        values = self.backups.values()
+        if len(values) < 2:
+            return None
+        diffs = sorted(b - a for a, b in zip(values, values[1:]))
+        mid = len(diffs) // 2
+        if len(diffs) % 2:
+            return diffs[mid]
+        return (diffs[mid - 1] + diffs[mid]) / 2
+
+    def expected_next(self) -> Optional[float]:
+        '''
+        Returns the time the next backup is expected at, or None if unknown.
+        '''
+        interval = self.interval()
+        last = self.backups.last()
+        if interval is None or last is None or interval <= 0:
+            return None
+        return last + interval
+
+    def missed(self, now: float) -> int:
+        '''
+        Returns the number of backups missed since the last one, based on the usual interval.
+        '''
+        interval = self.interval()
+        last = self.backups.last()
+        if interval is None or last is None or interval <= 0:
+            return 0
+        return max(0, int((now - last - MISSED_GRACE * interval) // interval))
+
+    def status_age(self, now: float) -> Optional[float]:
+        '''
+        Returns the seconds since the last status change, or None if no status was recorded yet.
+        '''
+        last = self.status_changes.last()
+        if last is None:
+            return None
+        return max(0.0, now - last)
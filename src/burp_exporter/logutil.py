@@ -0,0 +1,70 @@
+
+from typing import Any
+
+#: Payload logging modes: ``summary`` logs sizes and counts only, ``full`` logs the payload, truncated
+PAYLOAD_MODES = ('summary', 'full')
+
+_mode = 'summary'
+_max_chars = 2048
+
+
+def set_payload_mode(mode: str, max_chars: int = 2048) -> None:
+    '''
+    Sets how payloads wrapped by :func:`~burp_exporter.logutil.payload` are logged.
+
+    :param mode: One of :data:`PAYLOAD_MODES`.
+    :param max_chars: Payloads are truncated to this length in ``full`` mode.
+    '''
+    global _mode, _max_chars
+    if mode not in PAYLOAD_MODES:
+        raise ValueError(f'Invalid payload mode {mode}')
+    _mode = mode
+    _max_chars = max_chars
+
+
+def full_payloads() -> bool:
+    '''
+    Returns True if payloads are logged in full (truncated) rather than summarized.
+    '''
+    return _mode == 'full'
+
+
+def summarize(obj: Any) -> str:
+    '''
+    Describes `obj` by its type and size, without formatting its content.
+    '''
+    if isinstance(obj, dict):
+        parts = [f'{k}: {len(v)} items' if isinstance(v, (list, dict)) else str(k) for k, v in obj.items()]
+        return f'<dict with {len(obj)} keys ({", ".join(parts)})>'
+    if isinstance(obj, (list, tuple, set)):
+        return f'<{type(obj).__name__} with {len(obj)} items>'
+    if isinstance(obj, (str, bytes)):
+        return f'<{type(obj).__name__} of length {len(obj)}>'
+    return f'<{type(obj).__name__}>'
+
+
+class Payload:
+    '''
+    Wraps a payload for logging. Formatting is deferred until the log record is emitted, so passing it as an argument
+    to a disabled log call costs almost nothing.
+    '''
+
+    __slots__ = ('_obj',)
+
+    def __init__(self, obj: Any) -> None:
+        self._obj = obj
+
+    def __str__(self) -> str:
+        if _mode != 'full':
+            return summarize(self._obj)
+        text = self._obj if isinstance(self._obj, str) else repr(self._obj)
+        if len(text) > _max_chars:
+            return f'{text[:_max_chars]}... ({len(text)} characters)'
+        return text
+
+
+def payload(obj: Any) -> Payload:
+    '''
+    Wraps `obj` for lazy logging, see :class:`~burp_exporter.logutil.Payload`.
+    '''
+    return Payload(obj)
@@ -0,0 +1,85 @@
+
+import contextlib
+import logging
+import time
+from prometheus_client import Counter, Histogram
+from typing import Iterator, Tuple
+
+log = logging.getLogger('burp_exporter.loopmonitor')
+
+LOOP_LAG = Histogram('burp_exporter_loop_lag_seconds',
+                     'Time a main loop iteration spent outside of waiting for data, plus delays in returning from the wait',
+                     buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+LOOP_STALLS = Counter('burp_exporter_loop_stalls', 'Main loop iterations whose lag exceeded the stall threshold')
+
+
+class LoopMonitor:
+    '''
+    Measures the lag of the main loop: the time each iteration spends working instead of waiting in ``select``, plus
+    the time the wait overran its timeout. Work is attributed to phases per server, and if an iteration exceeds the
+    stall threshold, the slowest phase is logged.
+
+    :param threshold: Lag in seconds above which an iteration is considered a stall.
+    '''
+
+    def __init__(self, threshold: float) -> None:
+        self._threshold = threshold
+        self._start = time.monotonic()
+        self._waited = 0.0
+        self._overrun = 0.0
+        # (duration, server, phase) of the slowest phase of the current iteration
+        self._slowest: Tuple[float, str, str] = (0.0, '', '')
+
+    def start(self) -> None:
+        '''
+        Marks the start of an iteration.
+        '''
+        self._start = time.monotonic()
+        self._waited = 0.0
+        self._overrun = 0.0
+        self._slowest = (0.0, '', '')
+
+    @contextlib.contextmanager
+    def phase(self, server: str, phase: str) -> Iterator[None]:
+        '''
+        Context manager timing a phase of work for a server.
+        '''
+        t = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - t
+            if elapsed > self._slowest[0]:
+                self._slowest = (elapsed, server, phase)
+
+    @contextlib.contextmanager
+    def wait(self, timeout: float) -> Iterator[None]:
+        '''
+        Context manager around the ``select`` call, `timeout` is the timeout passed to it.
+        '''
+        t = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - t
+            self._waited += elapsed
+            self._overrun += max(0.0, elapsed - timeout)
+
+    def finish(self) -> float:
+        '''
+        Marks the end of an iteration, records its lag and logs a warning if it exceeds the threshold.
+
+        :return: The lag in seconds.
+        '''
+        lag = time.monotonic() - self._start - self._waited + self._overrun
+        LOOP_LAG.observe(lag)
+        if lag > self._threshold:
+            LOOP_STALLS.inc()
+            duration, server, phase = self._slowest
+            if server:
+                log.warning(f'Main loop stalled for {lag:.2f} seconds, slowest: {phase} for {server} ({duration:.2f} seconds)')
+            elif phase:
+                log.warning(f'Main loop stalled for {lag:.2f} seconds, slowest: {phase} ({duration:.2f} seconds)')
+            else:
+                log.warning(f'Main loop stalled for {lag:.2f} seconds')
+        return lag
@@ -0,0 +1,80 @@
+
+from typing import Optional
+
+
+class Progress:
+    '''
+    Live progress of a running client, compiled from the counters the server sends for it.
+    '''
+
+    __slots__ = ('phase', 'files', 'files_estimated', 'bytes', 'bytes_estimated', 'timestamp', 'throughput')
+
+    def __init__(self, phase: str, files: int, files_estimated: int, bytes: int, bytes_estimated: int,
+                 timestamp: float) -> None:
+        #: Phase the backup is in, e.g. ``backup_stage1``
+        self.phase = phase
+        #: Number of files processed so far
+        self.files = files
+        #: Number of files found while scanning
+        self.files_estimated = files_estimated
+        #: Number of bytes processed so far
+        self.bytes = bytes
+        #: Estimated number of bytes
+        self.bytes_estimated = bytes_estimated
+        #: When the counters were received
+        self.timestamp = timestamp
+        #: Bytes per second since the previous update, if there was one
+        self.throughput: Optional[float] = None
+
+    @property
+    def ratio(self) -> float:
+        '''
+        Completed fraction (0 to 1), based on the bytes if an estimate is available, on the files otherwise.
+        '''
+        if self.bytes_estimated > 0:
+            return min(self.bytes / self.bytes_estimated, 1.0)
+        if self.files_estimated > 0:
+            return min(self.files / self.files_estimated, 1.0)
+        return 0.0
+
+    def follow(self, previous: 'Progress') -> None:
+        '''
+        Calculates the throughput relative to the `previous` update of the same client.
+        '''
+        elapsed = self.timestamp - previous.timestamp
+        if elapsed > 0 and self.bytes >= previous.bytes:
+            self.throughput = (self.bytes - previous.bytes) / elapsed
+        else:
+            self.throughput = previous.throughput
+
+
+def parse_progress(entry: dict, timestamp: float) -> Optional[Progress]:
+    '''
+    Compiles the progress of a client from its entry in the answer to a ``c:<client>`` query. The counters are either
+    part of the entry itself or of its ``children`` (one per running child process), in which case they are summed up.
+
+    :param entry: The client's entry in the ``clients`` list.
+    :param timestamp: Time the data was received.
+    :return: The progress, or None if the entry contains neither a phase nor counters.
+    '''
+    phase: Optional[str] = None
+    found = False
+    files = files_estimated = bytes_ = bytes_estimated = 0
+    for child in entry.get('children') or [entry]:
+        if phase is None and child.get('phase'):
+            phase = str(child['phase'])
+        for counter in child.get('counters') or []:
+            name = counter.get('name')
+            if name == 'total':
+                files += int(counter.get('count', 0))
+                files_estimated += int(counter.get('scanned', 0))
+            elif name == 'bytes':
+                bytes_ += int(counter.get('count', 0))
+            elif name == 'bytes_estimated':
+                bytes_estimated += int(counter.get('count', 0))
+            else:
+                continue
+            found = True
+    if phase is None and not found:
+        return None
+    return Progress(phase or 'unknown', files, files_estimated, bytes_, bytes_estimated, timestamp)
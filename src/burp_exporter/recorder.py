@@ -0,0 +1,96 @@
+
+import logging
+import os
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+log = logging.getLogger('burp_exporter.recorder')
+
+#: Written at the start of every recording
+MAGIC = b'BURPREC1'
+#: Header of each record: timestamp, record kind, length of the server name, length of the data
+HEADER = struct.Struct('!dcHI')
+
+#: Data received during the handshake (``raw_read``)
+KIND_HANDSHAKE = b'h'
+#: Data received by ``read`` that is followed by more data of the same response
+KIND_PARTIAL = b'r'
+#: Data received by ``read`` that completes a response
+KIND_COMPLETE = b'R'
+#: A query sent to the server, the data is ``<query kind>:<query>``
+KIND_QUERY = b'q'
+
+
+class Record(NamedTuple):
+    timestamp: float
+    kind: bytes
+    server: str
+    data: bytes
+
+
+class Recorder:
+    '''
+    Appends raw protocol data to a recording file. The file starts with :data:`MAGIC`, followed by records consisting
+    of a :data:`HEADER`, the server name and the data. Passwords are never recorded, as the data sent during the
+    handshake is not part of the recording.
+
+    :param path: File to append to. It is created if it does not exist.
+    '''
+
+    def __init__(self, path: str) -> None:
+        self._path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._fh: Optional[BinaryIO] = open(self._path, 'ab')
+        if self._fh.tell() == 0:
+            self._fh.write(MAGIC)
+        log.info(f'Recording to {self._path}')
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def record(self, server: str, kind: bytes, data: bytes, timestamp: Optional[float] = None) -> None:
+        '''
+        Appends a record.
+
+        :param server: Name of the server the data belongs to.
+        :param kind: One of the ``KIND_*`` constants.
+        :param data: The raw data.
+        :param timestamp: Time of the event, defaults to now.
+        '''
+        name = server.encode('utf-8')
+        with self._lock:
+            if self._fh is None:
+                return
+            self._fh.write(HEADER.pack(time.time() if timestamp is None else timestamp, kind, len(name), len(data)))
+            self._fh.write(name)
+            self._fh.write(data)
+            self._fh.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+def read_recording(path: str) -> Iterator[Record]:
+    '''
+    Reads the records from a recording file. A truncated record at the end (e.g. from a crash) is ignored.
+    '''
+    with open(os.path.expanduser(path), 'rb') as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            raise IOError(f'{path} is not a recording')
+        while True:
+            header = fh.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            timestamp, kind, name_len, data_len = HEADER.unpack(header)
+            name = fh.read(name_len)
+            data = fh.read(data_len)
+            if len(name) < name_len or len(data) < data_len:
+                log.warning(f'Truncated record at the end of {path}')
+                break
+            yield Record(timestamp, kind, name.decode('utf-8'), data)
@@ -0,0 +1,136 @@
+
+import argparse
+import logging
+import sys
+import time
+from typing import Dict, List, Optional
+
+from .client import Client
+from .recorder import KIND_COMPLETE, KIND_PARTIAL, KIND_QUERY, read_recording
+from .store import render
+from .types import ClientSettings
+
+log = logging.getLogger('burp_exporter.replay')
+
+
+class ReplayStats:
+    '''
+    Statistics collected while replaying a recording.
+    '''
+
+    def __init__(self) -> None:
+        #: Number of chunks fed to the clients
+        self.chunks = 0
+        #: Number of complete answers handled
+        self.responses = 0
+        #: Number of bytes fed to the clients
+        self.bytes = 0
+        #: Number of answers or client entries that could not be handled
+        self.errors = 0
+        #: Seconds spent in buffering and parsing
+        self.parse_seconds = 0.0
+        #: Seconds spent rendering
+        self.render_seconds = 0.0
+        #: Wall clock duration of the replay
+        self.wall_seconds = 0.0
+
+    def report(self) -> str:
+        busy = self.parse_seconds + self.render_seconds
+        lines = [
+            f'chunks:     {self.chunks}',
+            f'responses:  {self.responses} ({self.errors} errors)',
+            f'bytes:      {self.bytes}',
+            f'parse:      {self.parse_seconds:.3f} s',
+            f'render:     {self.render_seconds:.3f} s',
+            f'wall:       {self.wall_seconds:.3f} s',
+        ]
+        if busy > 0:
+            lines.append(f'throughput: {self.bytes / busy / 1e6:.2f} MB/s, {self.responses / busy:.1f} responses/s')
+        return '\n'.join(lines) + '\n'
+
+
+def make_client(server: str) -> Client:
+    '''
+    Creates a client without connection, used as a sink for the replayed data.
+    '''
+    return Client(ClientSettings(name=server, cname='replay', password='', burp_host='', burp_port=0, burp_cname='',
+                                 tls_ca_cert='', tls_cert='', tls_key=''))
+
+
+def replay(path: str, speed: float = 0, do_render: bool = True, servers: Optional[List[str]] = None) -> ReplayStats:
+    '''
+    Feeds a recording through :func:`~burp_exporter.client.Client.receive` (and thus the parser) and, after each
+    complete answer, through the renderer.
+
+    :param path: The recording.
+    :param speed: 0 to replay as fast as possible, otherwise a factor for the recorded pace (1 = recorded speed).
+    :param do_render: Render the metrics of the server after each answer.
+    :param servers: Only replay the data of these servers, all if None.
+    :return: The statistics.
+    '''
+    stats = ReplayStats()
+    clients: Dict[str, Client] = dict()
+    first_ts: Optional[float] = None
+    start = time.monotonic()
+
+    for record in read_recording(path):
+        if servers is not None and record.server not in servers:
+            continue
+        if speed > 0:
+            if first_ts is None:
+                first_ts = record.timestamp
+            delay = (record.timestamp - first_ts) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        client = clients.get(record.server)
+        if client is None:
+            client = clients[record.server] = make_client(record.server)
+
+        if record.kind == KIND_QUERY:
+            # restore the state the client was in when the answer arrived, so the answer is routed the same way
+            client._query_kind = record.data.decode('utf-8').split(':', 1)[0]
+            client._in_flight = True
+        elif record.kind in (KIND_PARTIAL, KIND_COMPLETE):
+            stats.chunks += 1
+            stats.bytes += len(record.data)
+            errors = client.parse_errors + client.limit_exceeded
+            t = time.perf_counter()
+            try:
+                complete = client.receive(record.data)
+            except Exception as e:
+                log.warning(f'Error handling data of {record.server}: {str(e)}')
+                client.clear_buffer()
+                stats.errors += 1
+                complete = False
+            stats.parse_seconds += time.perf_counter() - t
+            # receive() drops the answer on protocol errors and counts them itself
+            stats.errors += client.parse_errors + client.limit_exceeded - errors
+            if complete:
+                stats.responses += 1
+                if do_render:
+                    t = time.perf_counter()
+                    render([client.store])
+                    stats.render_seconds += time.perf_counter() - t
+
+    stats.wall_seconds = time.monotonic() - start
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Replays a recording made with burp_exporter --record through the '
+                                     'parser and the renderer and reports the throughput.')
+    parser.add_argument('recording', type=str, help='Recording file')
+    parser.add_argument('-s', '--speed', type=float, default=0,
+                        help='Replay at this multiple of the recorded pace, 0 (default) replays as fast as possible')
+    parser.add_argument('--server', action='append', help='Only replay this server, may be given multiple times')
+    parser.add_argument('--no-render', action='store_true', help='Do not render after each answer')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    stats = replay(args.recording, speed=args.speed, do_render=not args.no_render, servers=args.server)
+    sys.stdout.write(stats.report())
+
+
+if __name__ == '__main__':
+    main()
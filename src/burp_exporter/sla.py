@@ -0,0 +1,132 @@
+
+import fnmatch
+import heapq
+import re
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from .types import ClientInfo
+
+#: Maximum backup age if no other value is configured: 26 hours, a day plus some slack for daily backups
+DEFAULT_MAX_AGE = 26 * 3600
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_duration(value: Union[str, int, float]) -> float:
+    '''
+    Parses a duration such as ``90``, ``30m``, ``6h`` or ``1d12h`` into seconds.
+    '''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value).strip()
+    parts = re.findall(r'(\d+(?:\.\d+)?)([smhdw])', text)
+    if not parts or ''.join(n + u for n, u in parts) != text:
+        raise ValueError(f'Invalid duration "{value}"')
+    return sum(float(n) * _UNITS[u] for n, u in parts)
+
+
+class SlaPolicy:
+    '''
+    Maps clients to the maximum age their most recent backup may have. Rules are checked in order: client name
+    patterns (shell-style, see `fnmatch`) first, then burp labels. The first match wins, clients matching no rule use
+    the default.
+
+    :param default: Maximum age in seconds for clients not matching any rule.
+    :param clients: List of (pattern, max age) for client names.
+    :param labels: List of (label, max age), where label is matched against the client's labels (e.g. ``team=db``).
+    '''
+
+    def __init__(self, default: float = DEFAULT_MAX_AGE, clients: Optional[List[Tuple[str, float]]] = None,
+                 labels: Optional[List[Tuple[str, float]]] = None) -> None:
+        self.default = default
+        self.clients = clients or list()
+        self.labels = labels or list()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> 'SlaPolicy':
+        '''
+        Creates a policy from the ``backup_sla`` section of the configuration file::
+
+            backup_sla:
+              default: 26h
+              clients:
+                "db-*": 6h
+              labels:
+                team=db: 6h
+
+        :raises ValueError: If a duration is invalid.
+        '''
+        if not isinstance(cfg, dict):
+            raise ValueError('backup_sla must be a mapping')
+        return cls(
+            default=parse_duration(cfg.get('default', DEFAULT_MAX_AGE)),
+            clients=[(str(k), parse_duration(v)) for k, v in (cfg.get('clients') or {}).items()],
+            labels=[(str(k), parse_duration(v)) for k, v in (cfg.get('labels') or {}).items()],
+        )
+
+    def max_age(self, info: ClientInfo) -> float:
+        '''
+        Returns the maximum backup age for the client.
+        '''
+        for pattern, age in self.clients:
+            if fnmatch.fnmatchcase(info.name, pattern):
+                return age
+        if info.labels:
+            for label, age in self.labels:
+                if label in info.labels:
+                    return age
+        return self.default
+
+
+class SlaEvaluator:
+    '''
+    Evaluates a :class:`~burp_exporter.sla.SlaPolicy` incrementally. The deadline (time of the last backup plus the
+    maximum age) is only recalculated for clients whose data changed. Clients that are within their deadline are kept
+    in a heap ordered by deadline, so advancing the clock only touches the clients that become overdue.
+    '''
+
+    def __init__(self, policy: SlaPolicy) -> None:
+        self._policy = policy
+        self._deadlines: Dict[str, float] = dict()
+        # (deadline, name), may contain stale entries which are skipped when popped
+        self._heap: List[Tuple[float, str]] = list()
+        self._overdue: Set[str] = set()
+
+    @property
+    def overdue(self) -> Set[str]:
+        '''
+        Names of the clients whose most recent backup is older than allowed.
+        '''
+        return self._overdue
+
+    def update(self, clients: List[ClientInfo], removed: Set[str], now: float) -> None:
+        '''
+        Updates the deadlines of the `clients` that changed and drops the `removed` clients, then advances to `now`.
+        '''
+        for name in removed:
+            self._deadlines.pop(name, None)
+            self._overdue.discard(name)
+        for info in clients:
+            last = max((b.timestamp for b in info.backups if 'current' in b.flags), default=None)
+            # clients without a finished backup are overdue right away
+            deadline = (last + self._policy.max_age(info)) if last is not None else float('-inf')
+            self._deadlines[info.name] = deadline
+            if deadline < now:
+                self._overdue.add(info.name)
+            else:
+                self._overdue.discard(info.name)
+                heapq.heappush(self._heap, (deadline, info.name))
+        self.advance(now)
+
+    def advance(self, now: float) -> None:
+        '''
+        Marks the clients whose deadline passed by `now` as overdue.
+        '''
+        while self._heap and self._heap[0][0] < now:
+            deadline, name = heapq.heappop(self._heap)
+            if self._deadlines.get(name) == deadline:
+                self._overdue.add(name)
+        # drop stale entries once they make up most of the heap
+        if len(self._heap) > 2 * len(self._deadlines) + 16:
+            self._heap = [(d, n) for n, d in self._deadlines.items() if n not in self._overdue]
+            heapq.heapify(self._heap)
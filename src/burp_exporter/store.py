@@ -0,0 +1,255 @@
+
+import functools
+import threading
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.metrics_core import Metric
+from prometheus_client.utils import floatToGoString
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+
+def escape_label_value(value: str) -> str:
+    '''
+    Escapes a label value for use in the text exposition format.
+    '''
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_value(value: float) -> str:
+    '''
+    Formats a sample value. Integers (which make up most of the samples) are formatted directly, everything else is
+    handed to `floatToGoString`.
+    '''
+    if type(value) is int:
+        return str(value)
+    return floatToGoString(value)
+
+
+class MetricFamily:
+    '''
+    Columnar storage of a single metric family of one server. The samples are kept as parallel lists of client names,
+    values, optional timestamps and optional additional label values. The columns are replaced as a whole by
+    :func:`~burp_exporter.store.MetricFamily.replace`, so a concurrent renderer always sees a consistent set.
+
+    Families either have no labels besides ``server`` (server-level metrics), or their first label is usually ``name``,
+    the name of the client. Additional labels follow after the first one. The "names" column holds the values of the
+    first label.
+    '''
+
+    __slots__ = ('_store', 'name', 'documentation', 'type', 'labelnames', '_columns', '_suffixes')
+
+    def __init__(self, store: 'MetricStore', name: str, documentation: str, mtype: str, labelnames: Sequence[str]) -> None:
+        self._store = store
+        self.name = name
+        self.documentation = documentation
+        self.type = mtype
+        self.labelnames = tuple(labelnames)
+        self._columns: Tuple[List[str], List[float], Optional[List[Optional[float]]], Optional[List[Tuple[str, ...]]]] = (list(), list(), None, None)
+        # escaped label strings of the additional labels, keyed by their values
+        self._suffixes: Dict[Tuple[str, ...], str] = dict()
+
+    def __len__(self) -> int:
+        return len(self._columns[1])
+
+    @property
+    def sample_name(self) -> str:
+        '''
+        Name of the samples, with the suffixes the text format requires.
+        '''
+        if self.type == 'counter':
+            return self.name + '_total'
+        return self.name
+
+    def replace(self, names: List[str], values: List[float], timestamps: Optional[List[Optional[float]]] = None,
+                extra: Optional[List[Tuple[str, ...]]] = None) -> None:
+        '''
+        Replaces the samples of this family.
+
+        :param names: Client name (value of the first label) for each sample.
+        :param values: Sample values, one for each entry in ``names``.
+        :param timestamps: Optional timestamps (in seconds), one for each entry in ``names``.
+        :param extra: Values of the labels following the first one, one tuple for each entry in ``names``.
+        '''
+        if len(names) != len(values) \
+                or (timestamps is not None and len(timestamps) != len(values)) \
+                or (extra is not None and len(extra) != len(values)):
+            raise ValueError(f'Column length mismatch in {self.name}')
+        if (extra is not None) != (len(self.labelnames) > 1):
+            raise ValueError(f'Additional label values for {self.name} do not match its labels')
+        self._columns = (names, values, timestamps, extra)
+
+    def set(self, value: float) -> None:
+        '''
+        Shortcut for server-level families that hold exactly one sample.
+        '''
+        self._columns = ([''], [value], None, None)
+
+    def header(self) -> str:
+        '''
+        Returns the ``HELP`` and ``TYPE`` lines of the family.
+        '''
+        doc = self.documentation.replace('\\', r'\\').replace('\n', r'\n')
+        return f'# HELP {self.sample_name} {doc}\n# TYPE {self.sample_name} {self.type}\n'
+
+    def prune(self) -> None:
+        '''
+        Drops cached label suffixes that are not used by the current samples.
+        '''
+        extra = self._columns[3]
+        used = set(extra) if extra is not None else set()
+        self._suffixes = {k: v for k, v in self._suffixes.items() if k in used}
+
+    def _suffix(self, values: Tuple[str, ...]) -> str:
+        try:
+            return self._suffixes[values]
+        except KeyError:
+            suffix = ''.join(f',{k}="{escape_label_value(v)}"' for k, v in zip(self.labelnames[1:], values))
+            self._suffixes[values] = suffix
+            return suffix
+
+    def samples(self) -> str:
+        '''
+        Renders all samples of the family in a single pass.
+        '''
+        names, values, timestamps, extra = self._columns
+        if not values:
+            return ''
+        sname = self.sample_name
+        if not self.labelnames:
+            labels = [self._store.server_labels] * len(values)
+        else:
+            prefix: Callable[[str], str]
+            if self.labelnames[0] == 'name':
+                prefix = self._store.client_labels
+            else:
+                prefix = functools.partial(self._store.prefix, self.labelnames[0])
+            if extra is None:
+                labels = [prefix(n) for n in names]
+            else:
+                suffix = self._suffix
+                labels = [prefix(n) + suffix(e) for n, e in zip(names, extra)]
+        if timestamps is None:
+            return ''.join([f'{sname}{{{lbl}}} {format_value(v)}\n' for lbl, v in zip(labels, values)])
+        return ''.join([
+            f'{sname}{{{lbl}}} {format_value(v)}' + (f' {int(ts * 1000):d}\n' if ts is not None else '\n')
+            for lbl, v, ts in zip(labels, values, timestamps)])
+
+    def to_metric(self) -> Metric:
+        '''
+        Converts the family to a `prometheus_client` metric family, for use with a `CollectorRegistry`.
+        '''
+        labelnames = ['server', *self.labelnames]
+        if self.type == 'counter':
+            metric: Metric = CounterMetricFamily(self.name, self.documentation, labels=labelnames)
+        else:
+            metric = GaugeMetricFamily(self.name, self.documentation, labels=labelnames)
+        names, values, timestamps, extra = self._columns
+        server = self._store.server
+        for i, (n, v) in enumerate(zip(names, values)):
+            labels = [server]
+            if self.labelnames:
+                labels.append(n)
+            if extra is not None:
+                labels.extend(extra[i])
+            metric.add_metric(labels, v, timestamps[i] if timestamps is not None else None)
+        return metric
+
+
+class MetricStore:
+    '''
+    Holds the metric families of one server. The escaped label prefix (``server`` and ``name``) of every client is
+    computed once and cached, so rendering a family boils down to a lookup and a join per sample.
+
+    :param server: Name of the server, used as value for the ``server`` label.
+    '''
+
+    def __init__(self, server: str) -> None:
+        self._server = server
+        self._server_labels = f'server="{escape_label_value(server)}"'
+        self._families: Dict[str, MetricFamily] = dict()
+        self._prefixes: Dict[str, str] = dict()
+        # prefixes of families whose first label is not "name", these are expected to be few
+        self._other_prefixes: Dict[str, str] = dict()
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[MetricFamily]:
+        return iter(list(self._families.values()))
+
+    @property
+    def server(self) -> str:
+        return self._server
+
+    @property
+    def server_labels(self) -> str:
+        return self._server_labels
+
+    def family(self, name: str, documentation: str, mtype: str = 'gauge', labelnames: Sequence[str] = ()) -> MetricFamily:
+        '''
+        Returns the family `name`, creating it if it does not exist yet. Families are rendered in the order they were
+        created in.
+        '''
+        try:
+            return self._families[name]
+        except KeyError:
+            fam = MetricFamily(self, name, documentation, mtype, labelnames)
+            self._families[name] = fam
+            return fam
+
+    def client_labels(self, client: str) -> str:
+        '''
+        Returns the escaped ``server`` and ``name`` labels (without curly braces) for the `client`.
+        '''
+        try:
+            return self._prefixes[client]
+        except KeyError:
+            prefix = f'{self._server_labels},name="{escape_label_value(client)}"'
+            with self._lock:
+                self._prefixes[client] = prefix
+            return prefix
+
+    def prefix(self, labelname: str, value: str) -> str:
+        '''
+        Returns the escaped ``server`` label and the label `labelname` with `value` (without curly braces). For
+        ``name``, use the faster :func:`~burp_exporter.store.MetricStore.client_labels`.
+        '''
+        key = f'{labelname}\0{value}'
+        try:
+            return self._other_prefixes[key]
+        except KeyError:
+            prefix = f'{self._server_labels},{labelname}="{escape_label_value(value)}"'
+            with self._lock:
+                self._other_prefixes[key] = prefix
+            return prefix
+
+    def prune(self, names: Set[str]) -> None:
+        '''
+        Drops cached label prefixes of clients that are not in `names` anymore, as well as cached prefixes and suffixes
+        that are not used by the current samples of any family. Call it after replacing the samples.
+        '''
+        with self._lock:
+            self._prefixes = {k: v for k, v in self._prefixes.items() if k in names}
+            used: Set[str] = set()
+            for fam in self._families.values():
+                if fam.labelnames and fam.labelnames[0] != 'name':
+                    used.update(f'{fam.labelnames[0]}\0{n}' for n in fam._columns[0])
+                fam.prune()
+            self._other_prefixes = {k: v for k, v in self._other_prefixes.items() if k in used}
+
+
+def render(stores: Iterable[MetricStore]) -> bytes:
+    '''
+    Renders the given stores in the Prometheus text exposition format. Families with the same name from different
+    stores are merged, so ``HELP`` and ``TYPE`` are only emitted once per family.
+
+    :param stores: Stores to render.
+    :return: The rendered output.
+    '''
+    families: Dict[str, List[MetricFamily]] = dict()
+    for store in stores:
+        for fam in store:
+            families.setdefault(fam.name, []).append(fam)
+    output: List[str] = list()
+    for fams in families.values():
+        output.append(fams[0].header())
+        for fam in fams:
+            output.append(fam.samples())
+    return ''.join(output).encode('utf-8')
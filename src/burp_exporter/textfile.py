@@ -0,0 +1,55 @@
+
+import logging
+import os
+import re
+import tempfile
+from typing import Dict
+
+log = logging.getLogger('burp_exporter.textfile')
+
+
+class TextfileWriter:
+    '''
+    Writes the exposition of each server to ``<directory>/burp_<server>.prom`` for consumption by the textfile
+    collector of the node_exporter. Files are replaced atomically by writing to a temporary file in the same directory
+    and renaming it, and writing is skipped if the content did not change since the last write.
+
+    :param directory: Directory watched by the textfile collector.
+    '''
+
+    def __init__(self, directory: str) -> None:
+        self._directory = os.path.expanduser(directory)
+        self._last: Dict[str, bytes] = dict()
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def path(self, server: str) -> str:
+        '''
+        Returns the path of the file for `server`. Characters other than letters, digits, ``-``, ``_`` and ``.`` are
+        replaced by ``_``.
+        '''
+        return os.path.join(self._directory, 'burp_' + re.sub(r'[^A-Za-z0-9_.-]', '_', server) + '.prom')
+
+    def write(self, server: str, content: bytes) -> bool:
+        '''
+        Writes the `content` for `server`.
+
+        :return: True if the file was written, False if it was skipped because the content is unchanged.
+        '''
+        path = self.path(server)
+        if self._last.get(path) == content:
+            return False
+        fd, tmp_path = tempfile.mkstemp(prefix='.burp_', suffix='.tmp', dir=self._directory)
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(content)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        log.debug('Wrote %d bytes to %s', len(content), path)
+        self._last[path] = content
+        return True
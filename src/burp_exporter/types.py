@@ -1,5 +1,5 @@
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from typing import Dict, List, Optional
 
 
@@ -48,10 +48,44 @@ class ClientSettings(BaseModel):
     cname: str
     #: Client password
     password: str
-    #: How long between refresh cycles
+    #: How long between refresh cycles. With adaptive_refresh, this is the interval used while all clients are idle
     refresh_interval_seconds: int = 60
+    #: Adapt the refresh interval to the backup activity
+    adaptive_refresh: bool = False
+    #: Refresh interval while a backup is running, if adaptive_refresh is enabled
+    refresh_interval_active_seconds: int = 10
+    #: Factor by which the interval grows with each refresh once all clients are idle
+    refresh_interval_decay: float = 2.0
+    #: Lower bound for the refresh interval
+    refresh_interval_min_seconds: int = 1
+    #: Upper bound for the refresh interval
+    refresh_interval_max_seconds: int = 86400
     #: Version we pretend to be
     version: str = '2.1.18'
+    #: Seconds between two progress queries for running clients, 0 disables progress queries
+    progress_interval_seconds: int = 10
+    #: Number of backups and run status changes remembered per client
+    history_size: int = 8
+    #: Seconds to wait for the answer to a query before the connection is considered dead
+    response_timeout_seconds: int = 30
+    #: Seconds of idleness after which a heartbeat is sent, 0 disables heartbeats
+    heartbeat_interval_seconds: int = 0
+    #: Seconds to wait for the TCP connection, the TLS handshake and each answer during the burp handshake
+    connect_timeout_seconds: int = 10
+    #: Seconds of idleness before TCP keepalive probes are sent, 0 disables TCP keepalive
+    tcp_keepalive_idle_seconds: int = 30
+    #: Seconds between TCP keepalive probes
+    tcp_keepalive_interval_seconds: int = 10
+    #: Number of unanswered TCP keepalive probes before the connection is dropped
+    tcp_keepalive_count: int = 3
+    #: Maximum number of bytes buffered for one answer of the server (including the handshake), the connection is
+    #: dropped if it is exceeded
+    receive_buffer_max_bytes: int = 64 * 1024 * 1024
+    #: Maximum payload length of a single frame, the connection is dropped if a frame header announces more. The frame
+    #: header can't express more than 65535 bytes
+    receive_frame_max_bytes: int = 65535
+    #: Shell-style patterns of the client names to include, all clients are included if empty
+    include_clients: List[str] = []
 
     #: Address of the burp server
     burp_host: str
@@ -66,3 +100,10 @@ class ClientSettings(BaseModel):
     tls_cert: str
     #: Client key file
     tls_key: str
+
+    @validator('refresh_interval_decay')
+    def decay_grows(cls, value: float) -> float:
+        # with a factor of 1 or less, the interval would never return to refresh_interval_seconds after a backup
+        if value <= 1:
+            raise ValueError('must be greater than 1')
+        return value
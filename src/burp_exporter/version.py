@@ -0,0 +1,20 @@
+
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def get_version() -> str:
+    '''
+    Returns the version of the installed package. ``importlib.metadata`` reads the metadata of this distribution only,
+    whereas ``pkg_resources`` scans every installed distribution on import, which noticeably slows down startup. The
+    latter is only used on Python versions that lack the former.
+    '''
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:  # Python < 3.8
+        from pkg_resources import get_distribution
+        return get_distribution('burp_exporter').version
+    try:
+        return version('burp_exporter')
+    except PackageNotFoundError:
+        return 'unknown'
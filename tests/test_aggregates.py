@@ -0,0 +1,59 @@
+
+from burp_exporter.aggregates import LabelAggregates, split_labels
+from burp_exporter.sla import SlaPolicy
+from burp_exporter.store import render
+from burp_exporter.types import ClientInfo
+
+from test_client import make_client
+
+
+def info(name: str, labels, run_status: str = 'idle') -> ClientInfo:
+    return ClientInfo(name=name, labels=labels, run_status=run_status, protocol=1, backups=[])
+
+
+def test_split_labels():
+    assert split_labels(info('a', ['team=db', 'test', 'team=db', 'env=prod=1'])) == (('env', 'prod=1'), ('team', 'db'))
+    assert split_labels(info('a', None)) == ()
+
+
+class TestLabelAggregates:
+
+    def test_incremental(self):
+        agg = LabelAggregates()
+        agg.update(info('a', ['team=db']))
+        agg.update(info('b', ['team=db', 'env=prod'], 'running'))
+        agg.update(info('c', ['team=web']))
+        assert agg.clients == {('team', 'db'): 2, ('env', 'prod'): 1, ('team', 'web'): 1}
+        assert agg.running == {('team', 'db'): 1, ('env', 'prod'): 1}
+
+        agg.update(info('b', ['team=web'], 'idle'))
+        assert agg.clients == {('team', 'db'): 1, ('team', 'web'): 2}
+        assert agg.running == {}
+
+        agg.set_overdue({'a', 'c'})
+        assert agg.overdue == {('team', 'db'): 1, ('team', 'web'): 1}
+        agg.remove('c')
+        assert agg.overdue == {('team', 'db'): 1}
+        assert agg.clients == {('team', 'db'): 1, ('team', 'web'): 1}
+        agg.set_overdue(set())
+        assert agg.overdue == {}
+
+    def test_columns(self):
+        agg = LabelAggregates()
+        agg.update(info('a', ['team=db']))
+        agg.update(info('b', ['team=web'], 'running'))
+        assert agg.columns(agg.running) == {'names': ['team', 'team'], 'values': [0, 1], 'extra': [('db',), ('web',)]}
+
+
+def test_client():
+    c = make_client(sla=SlaPolicy(default=3600))
+    c.parse_message({'clients': [
+        {'name': 'a', 'labels': ['team=db'], 'run_status': 'running', 'protocol': 1, 'backups': []},
+        {'name': 'b', 'labels': ['team=db'], 'run_status': 'idle', 'protocol': 1, 'backups': []},
+    ]})
+    output = render([c.store])
+    assert b'burp_label_clients{server="srv",label="team",value="db"} 2\n' in output
+    assert b'burp_label_clients_running{server="srv",label="team",value="db"} 1\n' in output
+    assert b'burp_label_clients_overdue{server="srv",label="team",value="db"} 2\n' in output
+    c.parse_message({'clients': []})
+    assert b'label="team"' not in render([c.store])
@@ -0,0 +1,68 @@
+
+import json
+
+import pytest
+
+from burp_exporter.api import ApiError, parse_page_params
+
+from test_client import make_client
+
+
+def message(*names: str, run_status: str = 'idle') -> dict:
+    return {'clients': [{'name': n, 'run_status': run_status, 'protocol': 1, 'backups': []} for n in names]}
+
+
+class TestSnapshot:
+
+    def test_page(self):
+        c = make_client()
+        c.parse_message(message('c3', 'c1', 'c2'))
+        page = json.loads(c.snapshot.page())
+        assert page['refresh'] == 1
+        assert page['next_cursor'] is None
+        assert [e['name'] for e in page['clients']] == ['c1', 'c2', 'c3']
+        assert page['clients'][0] == {'name': 'c1', 'labels': None, 'run_status': 'idle', 'protocol': 1,
+                                      'backups': [], 'updated': 1}
+
+    def test_fields(self):
+        c = make_client()
+        c.parse_message(message('c1'))
+        page = json.loads(c.snapshot.page(fields=['run_status']))
+        assert page['clients'] == [{'name': 'c1', 'run_status': 'idle'}]
+
+    def test_cursor(self):
+        c = make_client()
+        c.parse_message(message('c1', 'c2', 'c3', 'c4', 'c5'))
+        page = json.loads(c.snapshot.page(limit=2))
+        assert [e['name'] for e in page['clients']] == ['c1', 'c2']
+        page = json.loads(c.snapshot.page(limit=2, cursor=page['next_cursor']))
+        assert [e['name'] for e in page['clients']] == ['c3', 'c4']
+        page = json.loads(c.snapshot.page(limit=2, cursor=page['next_cursor']))
+        assert [e['name'] for e in page['clients']] == ['c5']
+        assert page['next_cursor'] is None
+
+    def test_since(self):
+        c = make_client()
+        c.parse_message(message('c1', 'c2'))
+        msg = message('c1', 'c2', 'c3')
+        msg['clients'][1]['run_status'] = 'running'
+        c.parse_message(msg)
+        page = json.loads(c.snapshot.page(since=1))
+        assert page['refresh'] == 2
+        assert [e['name'] for e in page['clients']] == ['c2', 'c3']
+        assert json.loads(c.snapshot.page(since=2))['clients'] == []
+
+    def test_unchanged_clients_reused(self):
+        c = make_client()
+        c.parse_message(message('c1', 'c2'))
+        first = list(c._clients)
+        c.parse_message(message('c1', 'c2'))
+        assert all(a is b for a, b in zip(first, c._clients))
+
+    def test_params(self):
+        assert parse_page_params({'fields': ['a,b', 'c'], 'limit': ['5'], 'since': ['3'], 'cursor': ['x']}) == \
+            {'fields': ['a', 'b', 'c'], 'limit': 5, 'since': 3, 'cursor': 'x'}
+        with pytest.raises(ApiError):
+            parse_page_params({'limit': ['abc']})
+        with pytest.raises(ApiError):
+            make_client().snapshot.page(limit=0)
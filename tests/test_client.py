@@ -0,0 +1,363 @@
+
+import datetime
+import json
+import pytest
+from pydantic import ValidationError
+
+from burp_exporter import client as client_module
+from burp_exporter.client import TERMINATOR, Client, ReceiveLimitError
+from burp_exporter.store import render
+from burp_exporter.types import ClientSettings
+
+
+class FakeSocket:
+
+    def __init__(self, data=None):
+        self.written = list()
+        self.data = list(data or [])
+        self.closed = False
+
+    def write(self, data: bytes) -> None:
+        self.written.append(data)
+
+    def read(self, bufsize: int) -> bytes:
+        return self.data.pop(0) if self.data else b''
+
+    def shutdown(self, how) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def make_client(sla=None, **kwargs) -> Client:
+    settings = dict(name='srv', cname='burp', password='abcdefgh', burp_host='127.0.0.1', burp_port=4972,
+                    burp_cname='burpserver', tls_ca_cert='ca.pem', tls_cert='client.pem', tls_key='client.key')
+    settings.update(kwargs)
+    return Client(ClientSettings(**settings), sla=sla)
+
+
+def connected_client(data=None, **kwargs) -> Client:
+    c = make_client(**kwargs)
+    c._socket = FakeSocket(data)
+    c._connected = True
+    return c
+
+
+class TestDeadline:
+
+    def test_refresh_sets_in_flight(self):
+        c = connected_client()
+        c.refresh()
+        assert c._in_flight
+        assert c.socket.written == [b'c0003c:\x00']
+        assert not c.check_deadline()
+
+    def test_deadline_exceeded(self):
+        c = connected_client(response_timeout_seconds=10)
+        c.refresh()
+        c._ts_query_sent -= datetime.timedelta(seconds=11)
+        assert c.check_deadline()
+        assert not c.connected
+        assert c.socket is None
+        assert c.timeouts == 1
+
+    def test_heartbeat(self):
+        c = connected_client(data=[TERMINATOR], heartbeat_interval_seconds=5)
+        c._ts_last_query = datetime.datetime.utcnow()
+        c._ts_query_sent -= datetime.timedelta(seconds=6)
+        c.refresh()
+        assert c.socket.written == [b'c0013j:pretty-print-off\x00']
+        c.read()
+        assert not c._in_flight
+        assert c.connected
+        assert c.updates == 0
+
+    def test_read_error(self):
+        c = connected_client()
+
+        def fail(bufsize):
+            raise TimeoutError('Connection timed out')
+
+        c.socket.read = fail
+        c.read()
+        assert not c.connected
+
+
+def test_memory_info():
+    c = make_client()
+    c.parse_message(clients_message('idle'))
+    info = c.memory_info()
+    assert info['clients'] == 1
+    assert info['fingerprints'] == 1
+    assert info['buf_bytes'] == 0
+    assert all(isinstance(v, int) for v in info.values())
+
+
+class TestReceiveLimits:
+
+    def test_buffer_limit(self):
+        c = connected_client(receive_buffer_max_bytes=100)
+        c.refresh()
+        c.receive(b'c0080' + b'x' * 80)
+        assert c.connected
+        c.receive(b'x' * 80)
+        assert not c.connected
+        assert c.socket is None
+        assert len(c._buf) == 0
+        assert c.limit_exceeded == 1
+        assert b'burp_receive_limit_exceeded_total{server="srv"} 1\n' in render([c.store])
+
+    def test_frame_limit_checked_on_header(self):
+        c = connected_client(receive_frame_max_bytes=100)
+        c.refresh()
+        c.receive(b'c0064' + b'x' * 100 + b'c0')
+        assert c.connected
+        c.receive(b'065')
+        assert not c.connected
+        assert c.limit_exceeded == 1
+
+    def test_multiple_frames(self):
+        c = connected_client()
+        c.refresh()
+        assert c.receive(frame(clients_message('idle')) + TERMINATOR)
+        assert c.client_count == 1
+        assert len(c._buf) == 0
+        assert c.connected
+
+    def test_answer_split_into_frames(self):
+        message = {'clients': [dict(clients_message('idle')['clients'][0], name=f'c{i:05d}') for i in range(3000)]}
+        data = json.dumps(message).encode('utf-8')
+        assert len(data) > 65535
+        frames = b''.join(b'c%04X' % len(data[i:i + 16000]) + data[i:i + 16000] for i in range(0, len(data), 16000))
+        c = connected_client()
+        c.refresh()
+        assert c.receive(frames + TERMINATOR)
+        assert c.client_count == 3000
+        assert c.connected
+
+    def test_garbage_frame(self):
+        c = connected_client()
+        c.refresh()
+        assert not c.receive(b'xZZZZgarbage')
+        assert not c.connected
+        assert c.socket is None
+        assert len(c._buf) == 0
+        assert c.parse_errors == 1
+        assert b'burp_parse_errors_total{server="srv"} 1\n' in render([c.store])
+
+    def test_invalid_json(self):
+        c = connected_client()
+        c.refresh()
+        assert not c.receive(b'c0003{"cc0002: }' + TERMINATOR)
+        assert not c.connected
+        assert c.parse_errors == 1
+
+    def test_handshake_limit(self, monkeypatch):
+        c = connected_client(data=[b'x' * 16, b'x' * 16], receive_buffer_max_bytes=20)
+        monkeypatch.setattr(client_module.select, 'select', lambda r, w, x, timeout: (r, [], []))
+        with pytest.raises(ReceiveLimitError):
+            c.raw_read(bufsize=16)
+        assert c.limit_exceeded == 1
+
+
+def clients_message(run_status: str) -> dict:
+    return {'clients': [{'name': 'c1', 'run_status': run_status, 'protocol': 1, 'backups': []}]}
+
+
+def test_unchanged_clients_not_validated_again():
+    c = make_client()
+    c.parse_message(clients_message('idle'))
+    info = c._clients[0]
+    assert isinstance(c._fingerprints['c1'], bytes)
+    c.parse_message(clients_message('idle'))
+    assert c._clients[0] is info
+    c.parse_message(clients_message('running'))
+    assert c._clients[0] is not info
+    assert c._clients[0].run_status == 'running'
+
+
+class TestAdaptiveRefresh:
+
+    def test_disabled(self):
+        c = make_client(refresh_interval_seconds=300)
+        c.parse_message(clients_message('running'))
+        assert c.refresh_interval == 300
+
+    def test_decay(self):
+        c = make_client(adaptive_refresh=True, refresh_interval_seconds=300, refresh_interval_active_seconds=10,
+                        refresh_interval_decay=4)
+        c.parse_message(clients_message('running'))
+        assert c.refresh_interval == 10
+        c.parse_message(clients_message('idle'))
+        assert c.refresh_interval == 40
+        c.parse_message(clients_message('idle'))
+        assert c.refresh_interval == 160
+        c.parse_message(clients_message('idle'))
+        assert c.refresh_interval == 300
+
+    def test_decay_must_grow(self):
+        with pytest.raises(ValidationError):
+            make_client(adaptive_refresh=True, refresh_interval_decay=1)
+
+    def test_bounds(self):
+        c = make_client(adaptive_refresh=True, refresh_interval_active_seconds=1, refresh_interval_min_seconds=5)
+        c.parse_message(clients_message('running'))
+        assert c.refresh_interval == 5
+        assert b'burp_refresh_interval_seconds{server="srv"} 5\n' in render([c.store])
+
+
+def frame(message: dict) -> bytes:
+    data = json.dumps(message)
+    return ('c%04X%s' % (len(data), data)).encode('utf-8')
+
+
+def answer(message: dict) -> bytes:
+    return frame(message) + TERMINATOR
+
+
+class TestSharedConnection:
+
+    message = {'clients': [
+        {'name': 'app1', 'run_status': 'running', 'protocol': 1, 'backups': []},
+        {'name': 'db1', 'run_status': 'idle', 'protocol': 1, 'backups': []},
+    ]}
+
+    def test_fan_out(self):
+        primary = connected_client(refresh_interval_seconds=300)
+        view = make_client(name='apps', include_clients=['app*'], refresh_interval_seconds=60)
+        primary.attach(view)
+        assert view.connected
+        assert primary.query_interval == 60
+
+        primary.refresh()
+        assert len(primary.socket.written) == 1
+        primary.receive(answer(self.message))
+        assert [c.name for c in primary._clients] == ['app1', 'db1']
+        assert [c.name for c in view._clients] == ['app1']
+        # validated once, shared by both views
+        assert view._clients[0] is primary._clients[0]
+        assert view.last_query == primary.last_query
+        assert b'burp_up{server="apps"} 1\n' in render([view.store])
+
+    def test_progress_of_views(self):
+        primary = connected_client(include_clients=['db*'])
+        view = make_client(name='apps', include_clients=['app*'])
+        primary.attach(view)
+        primary.refresh()
+        primary.receive(answer(self.message))
+        assert primary.running == {'app1'}
+        # the progress query for the client running in the view is sent right after the list
+        assert primary.socket.written[-1] == b'c0007c:app1\x00'
+
+        idle = {'clients': [dict(c, run_status='idle') for c in self.message['clients']]}
+        primary._ts_last_query -= datetime.timedelta(seconds=primary.query_interval + 1)
+        primary.receive(answer({'clients': []}))  # answer to the progress query
+        primary.refresh()
+        primary.receive(answer(idle))
+        assert primary.running == set()
+        assert primary._progress_queue == []
+        assert not primary._in_flight
+
+    def test_invalid_entry_counted_per_view(self, caplog):
+        message = {'clients': self.message['clients'] + [
+            {'name': 'app2', 'run_status': 'running'},
+            {'name': 'db2', 'run_status': 'idle'},
+        ]}
+        primary = connected_client(include_clients=['app*'])
+        view = make_client(name='apps', include_clients=['app*'])
+        other = make_client(name='dbs', include_clients=['db*'])
+        primary.attach(view)
+        primary.attach(other)
+        primary.refresh()
+        primary.receive(answer(message))
+        # validated once, counted by the views including the entry
+        assert len([r for r in caplog.records if 'Validation error' in r.getMessage()]) == 2
+        assert primary.parse_errors == 1
+        assert view.parse_errors == 1
+        assert other.parse_errors == 1
+        assert [c.name for c in view._clients] == ['app1']
+
+    def test_attach_twice(self):
+        primary = make_client()
+        view = make_client(name='view')
+        primary.attach(view)
+        with pytest.raises(ValueError):
+            make_client(name='other').attach(view)
+
+
+class TestProgress:
+
+    running = {'clients': [
+        {'name': 'c1', 'run_status': 'running', 'protocol': 1, 'backups': []},
+        {'name': 'c2', 'run_status': 'idle', 'protocol': 1, 'backups': []},
+    ]}
+    idle = {'clients': [
+        {'name': 'c1', 'run_status': 'idle', 'protocol': 1, 'backups': []},
+        {'name': 'c2', 'run_status': 'idle', 'protocol': 1, 'backups': []},
+    ]}
+
+    @staticmethod
+    def detail(num_bytes: int) -> dict:
+        return {'clients': [{'name': 'c1', 'run_status': 'running', 'children': [{
+            'action': 'backup', 'phase': 'backup_stage2', 'counters': [
+                {'name': 'total', 'type': 'Z', 'count': 10, 'scanned': 40},
+                {'name': 'bytes_estimated', 'count': 1000},
+                {'name': 'bytes', 'count': num_bytes},
+            ]}]}]}
+
+    def test_queries_running_clients(self):
+        c = connected_client(data=[frame(self.running), TERMINATOR, frame(self.detail(250)), TERMINATOR])
+        c.refresh()
+        c.read(bufsize=65536)
+        # the answer is not complete before its terminator arrived
+        assert c._in_flight
+        assert c.client_count == 0
+        assert len(c.socket.written) == 1
+        c.read(bufsize=65536)
+        assert c.client_count == 2
+        assert c.socket.written[-1] == b'c0005c:c1\x00'
+        c.read(bufsize=65536)
+        c.read(bufsize=65536)
+        assert not c._in_flight
+        output = render([c.store])
+        assert b'burp_client_progress_phase{server="srv",name="c1",phase="backup_stage2"} 1\n' in output
+        assert b'burp_client_progress_bytes{server="srv",name="c1"} 250\n' in output
+        assert b'burp_client_progress_files_estimated{server="srv",name="c1"} 40\n' in output
+        assert b'burp_client_progress_ratio{server="srv",name="c1"} 0.25\n' in output
+        assert b'name="c2"} 0\n' in output
+        assert b'burp_client_progress_bytes{server="srv",name="c2"}' not in output
+
+    def test_terminator_read_separately(self):
+        clients = {'clients': [dict(self.running['clients'][0], name=f'c{i}') for i in range(1, 6)]}
+        progress = {'clients': [dict(self.detail(250)['clients'][0])]}
+        c = connected_client(data=[frame(clients), TERMINATOR, frame(progress), TERMINATOR])
+        c.refresh()
+        c.read(bufsize=65536)
+        c.read(bufsize=65536)
+        assert c.client_count == 5
+        # the progress answer lists a single client, it must not be taken as the list of clients
+        c.read(bufsize=65536)
+        c.read(bufsize=65536)
+        assert c.client_count == 5
+        # one list query and one progress query for each running client, sent one after the other
+        assert c.socket.written[1] == b'c0005c:c1\x00'
+        assert c.socket.written[-1] == b'c0005c:c2\x00'
+        assert c._in_flight
+
+    def test_throughput(self):
+        c = connected_client()
+        c.parse_message(self.running)
+        c.parse_progress(self.detail(100))
+        c._progress['c1'].timestamp -= 2
+        c.parse_progress(self.detail(300))
+        assert c._progress['c1'].throughput == pytest.approx(100, rel=0.01)
+        assert b'burp_client_throughput_bytes_per_second{server="srv",name="c1"}' in render([c.store])
+
+    def test_dropped_when_idle(self):
+        c = connected_client()
+        c.parse_message(self.running)
+        c.parse_progress(self.detail(100))
+        c.parse_message(self.idle)
+        assert b'burp_client_progress' not in render([c.store]).replace(b'# HELP burp_client_progress', b'').replace(b'# TYPE burp_client_progress', b'')
+        assert not c._progress_queue
@@ -0,0 +1,84 @@
+
+import time
+
+import pytest
+
+from burp_exporter.daemon import ConfigError, Daemon
+
+from test_client import connected_client, make_client
+
+
+def make_daemon(tmp_path) -> Daemon:
+    cfg = tmp_path / 'burp_exporter.yaml'
+    cfg.write_text(f'serve_http: false\ntextfile_directory: {tmp_path}\n')
+    return Daemon(str(cfg), timeout=0)
+
+
+def test_write_error_keeps_loop_running(tmp_path, monkeypatch):
+    daemon = make_daemon(tmp_path)
+    client = connected_client()
+
+    def fail(data):
+        raise BrokenPipeError('Broken pipe')
+
+    client.socket.write = fail
+    daemon.add_client(client)
+
+    iterations = list()
+
+    def stop_after_two():
+        iterations.append(1)
+        daemon._stop = len(iterations) >= 2
+
+    monkeypatch.setattr(daemon, 'write_textfiles', stop_after_two)
+    monkeypatch.setattr(daemon, 'connect_client', lambda c: False)
+    daemon.run()
+    assert len(iterations) == 2
+    assert not client.connected
+
+
+ENTRY = '''  - name: {name}
+    burp_host: 127.0.0.1
+    burp_port: 4972
+    burp_cname: burpserver
+    cname: burp
+    password: {password}
+    tls_ca_cert: ca.pem
+    tls_cert: client.pem
+    tls_key: client.key
+    response_timeout_seconds: {timeout}
+'''
+
+
+def config_daemon(tmp_path, *entries) -> Daemon:
+    cfg = tmp_path / 'burp_exporter.yaml'
+    cfg.write_text(f'serve_http: false\ntextfile_directory: {tmp_path}\nclients:\n' + ''.join(
+        ENTRY.format(name=name, password=password, timeout=timeout) for name, password, timeout in entries))
+    return Daemon(str(cfg), timeout=0)
+
+
+def test_shared_connection(tmp_path, caplog):
+    daemon = config_daemon(tmp_path, ('a', 'secret', 30), ('b', 'secret', 10))
+    a, b = daemon.clients
+    assert b.primary is a
+    assert 'response_timeout_seconds are ignored' in caplog.text
+
+
+def test_shared_connection_credentials_differ(tmp_path):
+    with pytest.raises(ConfigError, match='differs in password'):
+        config_daemon(tmp_path, ('a', 'secret', 30), ('b', 'other', 30))
+
+
+def test_watchdog_notified_while_connecting(tmp_path, monkeypatch):
+    daemon = make_daemon(tmp_path)
+    daemon._timeout = 0.01
+    notified = list()
+    monkeypatch.setattr(daemon, 'notify_watchdog', lambda: notified.append(1))
+
+    def slow_connect(client):
+        time.sleep(0.1)
+        return False
+
+    monkeypatch.setattr(daemon, 'connect_client', slow_connect)
+    daemon.connect_clients([make_client(), make_client(name='other')])
+    assert len(notified) >= 5
@@ -0,0 +1,43 @@
+
+import threading
+import tracemalloc
+
+from burp_exporter.debug import format_collapsed, format_top, sample_stacks, start_debug_server
+
+
+def busy(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestProfile:
+
+    def test_sample_stacks(self):
+        stop = threading.Event()
+        t = threading.Thread(target=busy, args=(stop,), name='busy-thread')
+        t.start()
+        try:
+            stacks = sample_stacks(0.1, interval=0.001)
+        finally:
+            stop.set()
+            t.join()
+        assert any(s.startswith('busy-thread;') and 'busy (test_debug.py' in s for s in stacks)
+
+    def test_format(self):
+        stacks = {'main;a (x.py:1);b (x.py:5)': 3, 'main;a (x.py:1)': 1}
+        assert format_collapsed(stacks) == 'main;a (x.py:1) 1\nmain;a (x.py:1);b (x.py:5) 3\n'
+        top = format_top(stacks).splitlines()
+        assert top[0] == '4 samples'
+        assert top[2].split() == ['3', '3', 'b', '(x.py:5)']
+        assert top[3].split() == ['1', '4', 'a', '(x.py:1)']
+
+
+class TestMemory:
+
+    def test_tracing_started_with_server(self):
+        tracemalloc.stop()
+        try:
+            start_debug_server(0)
+            assert tracemalloc.is_tracing()
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,53 @@
+
+import threading
+import time
+
+import pytest
+
+from burp_exporter.handler import RENDERS_SAVED, SingleFlight
+
+
+class TestSingleFlight:
+
+    def test_shared(self):
+        sf = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = list()
+        results = list()
+
+        def work() -> bytes:
+            calls.append(1)
+            started.set()
+            release.wait()
+            return b'output'
+
+        before = RENDERS_SAVED._value.get()
+        leader = threading.Thread(target=lambda: results.append(sf.do('k', work)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=lambda: results.append(sf.do('k', work))) for _ in range(3)]
+        for t in followers:
+            t.start()
+        while RENDERS_SAVED._value.get() < before + 3:
+            time.sleep(0.001)
+        release.set()
+        for t in [leader] + followers:
+            t.join()
+        assert calls == [1]
+        assert results == [b'output'] * 4
+
+    def test_sequential_calls_not_shared(self):
+        sf = SingleFlight()
+        assert sf.do('k', lambda: b'a') == b'a'
+        assert sf.do('k', lambda: b'b') == b'b'
+
+    def test_error(self):
+        sf = SingleFlight()
+
+        def fail() -> bytes:
+            raise ValueError('boom')
+
+        with pytest.raises(ValueError):
+            sf.do('k', fail)
+        assert sf.do('k', lambda: b'ok') == b'ok'
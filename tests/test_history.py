@@ -0,0 +1,61 @@
+
+import pytest
+
+from burp_exporter.history import ClientHistory, RingBuffer
+
+from test_client import make_client
+
+
+DAY = 86400
+
+
+class TestRingBuffer:
+
+    def test_wrap(self):
+        r = RingBuffer(3)
+        assert r.last() is None
+        assert r.values() == []
+        for i in range(5):
+            r.append(i)
+        assert len(r) == 3
+        assert r.values() == [2, 3, 4]
+        assert r.last() == 4
+
+    def test_size(self):
+        with pytest.raises(ValueError):
+            RingBuffer(0)
+
+
+class TestClientHistory:
+
+    def test_expected_and_missed(self):
+        h = ClientHistory(4)
+        for i in range(6):
+            h.add_backup(i * DAY)
+        h.add_backup(3 * DAY)
+        assert h.backups.values() == [2 * DAY, 3 * DAY, 4 * DAY, 5 * DAY]
+        assert h.interval() == DAY
+        assert h.expected_next() == 6 * DAY
+        assert h.missed(5 * DAY + DAY) == 0
+        assert h.missed(5 * DAY + 1.5 * DAY) == 1
+        assert h.missed(5 * DAY + 2.5 * DAY) == 2
+
+    def test_status(self):
+        h = ClientHistory(4)
+        assert h.status_age(100) is None
+        h.set_status('idle', 10)
+        h.set_status('idle', 20)
+        assert h.status_age(100) == 90
+        h.set_status('running', 50)
+        assert h.status_age(100) == 50
+
+
+def test_client_history():
+    c = make_client()
+    for i in range(3):
+        c.parse_message({'clients': [{'name': 'c1', 'run_status': 'idle', 'protocol': 1, 'backups': [
+            {'number': i, 'timestamp': 1000 + i * DAY, 'flags': ['current']}]}]})
+    assert c._history['c1'].interval() == DAY
+    assert len(c._fam_backup_expected) == 1
+    c.parse_message({'clients': []})
+    assert c._history == {}
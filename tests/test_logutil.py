@@ -0,0 +1,39 @@
+
+import pytest
+
+from burp_exporter.logutil import payload, set_payload_mode, summarize
+
+
+@pytest.fixture(autouse=True)
+def reset_mode():
+    yield
+    set_payload_mode('summary')
+
+
+def test_summarize():
+    assert summarize({'clients': [1, 2, 3]}) == '<dict with 1 keys (clients: 3 items)>'
+    assert summarize([1, 2]) == '<list with 2 items>'
+    assert summarize('abc') == '<str of length 3>'
+
+
+def test_payload_modes():
+    p = payload({'clients': [{'name': 'x' * 100}]})
+    assert str(p) == '<dict with 1 keys (clients: 1 items)>'
+    set_payload_mode('full', max_chars=20)
+    assert str(p) == "{'clients': [{'name'... (127 characters)"
+    with pytest.raises(ValueError):
+        set_payload_mode('everything')
+
+
+class Exploding:
+
+    def __repr__(self) -> str:
+        raise AssertionError('formatted although debug logging is disabled')
+
+
+def test_lazy(caplog):
+    import logging
+    set_payload_mode('full')
+    log = logging.getLogger('burp_exporter.test')
+    log.setLevel(logging.INFO)
+    log.debug('payload: %s', payload(Exploding()))
@@ -0,0 +1,33 @@
+
+import logging
+import time
+
+from burp_exporter.loopmonitor import LoopMonitor
+
+
+def test_lag_excludes_wait():
+    m = LoopMonitor(threshold=1)
+    m.start()
+    with m.wait(1):
+        time.sleep(0.05)
+    assert m.finish() < 0.04
+
+
+def test_overrun_counts_as_lag():
+    m = LoopMonitor(threshold=1)
+    m.start()
+    with m.wait(0.01):
+        time.sleep(0.06)
+    assert m.finish() >= 0.05
+
+
+def test_stall_logged(caplog):
+    m = LoopMonitor(threshold=0.01)
+    m.start()
+    with m.phase('srv', 'fast'):
+        pass
+    with m.phase('srv', 'connect'):
+        time.sleep(0.03)
+    with caplog.at_level(logging.WARNING, logger='burp_exporter.loopmonitor'):
+        assert m.finish() >= 0.03
+    assert 'slowest: connect for srv' in caplog.text
@@ -0,0 +1,48 @@
+
+from burp_exporter.client import TERMINATOR, Client
+from burp_exporter.recorder import KIND_COMPLETE, KIND_PARTIAL, KIND_QUERY, Recorder, read_recording
+from burp_exporter.replay import replay
+from burp_exporter.types import ClientSettings
+
+from test_client import FakeSocket, answer
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / 'rec.bin')
+    data = answer({'clients': [{'name': 'c1', 'run_status': 'idle', 'protocol': 1, 'backups': []}]})
+    recorder = Recorder(path)
+    c = Client(ClientSettings(name='srv', cname='burp', password='secret', burp_host='127.0.0.1', burp_port=4972,
+                              burp_cname='burpserver', tls_ca_cert='ca.pem', tls_cert='client.pem',
+                              tls_key='client.key'), recorder=recorder)
+    # the terminator comes in a read of its own
+    body = data[:-len(TERMINATOR)]
+    chunks = [body[i:i + 64] for i in range(0, len(body), 64)] + [TERMINATOR]
+    c._socket = FakeSocket(chunks)
+    c._connected = True
+    c.refresh()
+    for _ in chunks:
+        c.read(bufsize=64)
+    recorder.close()
+    assert c.client_count == 1
+
+    records = list(read_recording(path))
+    assert [r.kind for r in records] == [KIND_QUERY] + [KIND_PARTIAL] * (len(chunks) - 1) + [KIND_COMPLETE]
+    assert all(r.server == 'srv' for r in records)
+    assert b''.join(r.data for r in records[1:]) == data
+    assert b'secret' not in open(path, 'rb').read()
+
+    stats = replay(path)
+    assert stats.responses == 1
+    assert stats.errors == 0
+    assert stats.bytes == len(data)
+
+
+def test_truncated(tmp_path):
+    path = str(tmp_path / 'rec.bin')
+    recorder = Recorder(path)
+    recorder.record('srv', KIND_COMPLETE, b'abc')
+    recorder.record('srv', KIND_COMPLETE, b'defg')
+    recorder.close()
+    with open(path, 'r+b') as fh:
+        fh.truncate(len(open(path, 'rb').read()) - 2)
+    assert [r.data for r in read_recording(path)] == [b'abc']
@@ -0,0 +1,60 @@
+
+import pytest
+
+from burp_exporter.sla import SlaEvaluator, SlaPolicy, parse_duration
+from burp_exporter.store import render
+from burp_exporter.types import ClientInfo
+
+from test_client import make_client
+
+HOUR = 3600
+
+
+def info(name: str, timestamp=None, labels=None) -> ClientInfo:
+    backups = [{'number': 1, 'timestamp': timestamp, 'flags': ['current']}] if timestamp is not None else []
+    return ClientInfo(name=name, labels=labels, run_status='idle', protocol=1, backups=backups)
+
+
+def test_parse_duration():
+    assert parse_duration(90) == 90
+    assert parse_duration('30m') == 1800
+    assert parse_duration('1d12h') == 36 * HOUR
+    for invalid in ['', '5x', 'h', '1h 2m']:
+        with pytest.raises(ValueError):
+            parse_duration(invalid)
+
+
+def test_policy():
+    policy = SlaPolicy.from_config({'default': '26h', 'clients': {'db-*': '2h'}, 'labels': {'team=db': '6h'}})
+    assert policy.max_age(info('web1')) == 26 * HOUR
+    assert policy.max_age(info('web1', labels=['team=db'])) == 6 * HOUR
+    assert policy.max_age(info('db-1', labels=['team=db'])) == 2 * HOUR
+
+
+class TestEvaluator:
+
+    def test_deadlines(self):
+        ev = SlaEvaluator(SlaPolicy(default=10 * HOUR))
+        ev.update([info('a', 0), info('b', 5 * HOUR), info('c')], set(), now=HOUR)
+        assert ev.overdue == {'c'}
+        ev.advance(11 * HOUR)
+        assert ev.overdue == {'a', 'c'}
+        ev.update([info('a', 10 * HOUR)], {'c'}, now=12 * HOUR)
+        assert ev.overdue == set()
+        ev.advance(16 * HOUR)
+        assert ev.overdue == {'b'}
+
+    def test_client(self):
+        c = make_client(sla=SlaPolicy(default=HOUR))
+        c.parse_message({'clients': [
+            {'name': 'old', 'run_status': 'idle', 'protocol': 1, 'backups': [{'number': 1, 'timestamp': 1000, 'flags': ['current']}]},
+            {'name': 'none', 'run_status': 'idle', 'protocol': 1, 'backups': []},
+        ]})
+        output = render([c.store])
+        assert b'burp_client_backup_overdue{server="srv",name="old"} 1\n' in output
+        assert b'burp_clients_overdue{server="srv"} 2\n' in output
+
+    def test_no_policy(self):
+        c = make_client()
+        c.parse_message({'clients': []})
+        assert b'overdue' not in render([c.store])
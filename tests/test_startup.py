@@ -0,0 +1,12 @@
+
+import subprocess
+import sys
+
+# modules that must not be loaded before the daemon is set up, see burp_exporter.cli
+DEFERRED = ('burp_exporter.daemon', 'burp_exporter.handler', 'prometheus_client', 'pydantic', 'yaml', 'pkg_resources')
+
+
+def test_cli_import_defers_heavy_modules():
+    code = 'import sys, burp_exporter.cli; print(" ".join(m for m in sys.argv[1:] if m in sys.modules))'
+    result = subprocess.run([sys.executable, '-c', code, *DEFERRED], check=True, stdout=subprocess.PIPE)
+    assert result.stdout.decode('utf-8').split() == []
@@ -0,0 +1,72 @@
+
+import json
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from burp_exporter.client import Client
+from burp_exporter.handler import generate
+from burp_exporter.store import MetricStore, render
+from burp_exporter.types import ClientSettings
+
+
+data_3c = '''{"clients":[{"name":"asdf","labels":["label1","label2"],"run_status":"idle","protocol":1,"backups":[]},{"name":"burp","labels":["team=cs","test"],"run_status":"running","protocol":1,"backups":[{"number":4,"timestamp":1567146136,"flags":["current","manifest"],"logs":{"list":["backup","backup_stats"]}},{"number":5,"timestamp":1567146200,"flags":["working"]}]},{"name":"test\\"client","run_status":"idle","protocol":1,"backups":[]}]}'''
+
+
+def make_client(name: str = 'srv') -> Client:
+    return Client(ClientSettings(name=name, cname='burp', password='abcdefgh', burp_host='127.0.0.1', burp_port=4972,
+                                 burp_cname='burpserver', tls_ca_cert='ca.pem', tls_cert='client.pem',
+                                 tls_key='client.key'))
+
+
+def samples(output: bytes) -> set:
+    result = set()
+    for family in text_string_to_metric_families(output.decode('utf-8')):
+        for s in family.samples:
+            result.add((s.name, tuple(sorted(s.labels.items())), s.value))
+    return result
+
+
+class TestStore:
+
+    def test_render_matches_generate(self):
+        c = make_client()
+        c.parse_message(json.loads(data_3c))
+        assert samples(render([c.store])) == samples(generate([c.registry]))
+
+    def test_render_escapes_labels(self):
+        c = make_client()
+        c.parse_message(json.loads(data_3c))
+        assert b'burp_client_backup_has_in_progress{server="srv",name="test\\"client"} 0\n' in render([c.store])
+
+    def test_render_merges_families(self):
+        c1 = make_client('one')
+        c2 = make_client('two')
+        c1.parse_message(json.loads(data_3c))
+        c2.parse_message(json.loads(data_3c))
+        output = render([c1.store, c2.store])
+        assert output.count(b'# TYPE burp_up gauge') == 1
+        assert b'burp_up{server="one"} 0\n' in output
+        assert b'burp_up{server="two"} 0\n' in output
+
+    def test_removed_client(self):
+        c = make_client()
+        c.parse_message(json.loads(data_3c))
+        c.parse_message({'clients': []})
+        output = render([c.store])
+        assert b'name="asdf"' not in output
+
+    def test_prune_label_caches(self):
+        store = MetricStore('srv')
+        fam = store.family('test_label', 'Test', labelnames=['label', 'value'])
+        for value in ('a', 'b'):
+            fam.replace(['team'], [1], extra=[(value,)])
+            render([store])
+            store.prune(set())
+        assert list(store._other_prefixes) == ['label\0team']
+        assert list(fam._suffixes) == [('b',)]
+
+    def test_timestamps(self):
+        store = MetricStore('srv')
+        fam = store.family('test', 'Test', labelnames=['name'])
+        fam.replace(['a', 'b'], [1, 2.5], timestamps=[1.5, None])
+        assert fam.samples() == 'test{server="srv",name="a"} 1 1500\ntest{server="srv",name="b"} 2.5\n'
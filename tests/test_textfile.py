@@ -0,0 +1,25 @@
+
+import os
+
+from burp_exporter.textfile import TextfileWriter
+
+
+class TestTextfileWriter:
+
+    def test_path(self, tmp_path):
+        w = TextfileWriter(str(tmp_path))
+        assert w.path('srv') == os.path.join(str(tmp_path), 'burp_srv.prom')
+        assert w.path('a/b c') == os.path.join(str(tmp_path), 'burp_a_b_c.prom')
+
+    def test_write(self, tmp_path):
+        w = TextfileWriter(str(tmp_path))
+        assert w.write('srv', b'burp_up{server="srv"} 1\n')
+        with open(w.path('srv'), 'rb') as fh:
+            assert fh.read() == b'burp_up{server="srv"} 1\n'
+        assert os.listdir(str(tmp_path)) == ['burp_srv.prom']
+
+    def test_write_unchanged(self, tmp_path):
+        w = TextfileWriter(str(tmp_path))
+        assert w.write('srv', b'a 1\n')
+        assert not w.write('srv', b'a 1\n')
+        assert w.write('srv', b'a 2\n')
@@ -0,0 +1,13 @@
+
+import pytest
+
+from burp_exporter.version import get_version
+
+
+def test_version():
+    metadata = pytest.importorskip('importlib.metadata')
+    try:
+        expected = metadata.version('burp_exporter')
+    except metadata.PackageNotFoundError:
+        expected = 'unknown'
+    assert get_version() == expected